@@ -1,16 +1,15 @@
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 import asyncpg
-from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.templating import Jinja2Templates
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, RedirectResponse
+from jinja2 import Environment, FileSystemLoader, pass_context
 
 from config import settings
+from database.session import PreparedConnection, init_connection, set_pool
 from features.harvest.router import router as harvest_router
 from features.models.router import router as models_router
 from features.analysis.router import router as analysis_router
@@ -18,14 +17,29 @@ from features.auth.router import router as auth_router
 from features.roi.router import router as roi_router
 from features.users.router import router as users_router
 from features.reports.router import router as reports_router
+from features.gee.service import close_http_session
+from middleware.cors_middleware import CachedCORSMiddleware
+from middleware.dispatch_middleware import SubAppDispatchMiddleware
+from middleware.session_middleware import TokenRefreshMiddleware
 from services.earth_engine_initializer import initialize_earth_engine
 from utils.logging import setup_logging
+from utils.static_files import CachedStaticFiles
 
-# 1. Configuração inicial
-load_dotenv()
+# 1. Configuração inicial (o .env já é carregado em config.py)
 setup_logging()
 logger = logging.getLogger(__name__)
 
+async def warm_up_pool(pool: asyncpg.Pool, size: int):
+    """
+    Adquire 'size' conexões em paralelo e executa um SELECT 1 em cada uma,
+    garantindo que o conjunto mínimo esteja aberto antes da primeira requisição.
+    """
+    async def _ping():
+        async with pool.acquire() as conn:
+            await conn.execute("SELECT 1")
+
+    await asyncio.gather(*(_ping() for _ in range(size)))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -35,43 +49,98 @@ async def lifespan(app: FastAPI):
     """
     logger.info("Iniciando servidor...")
 
-    # 1.1. Inicialização do banco de dados
-    logger.info("Criando pool de conexões com o banco de dados...")
     try:
-        app.state.pool = await asyncpg.create_pool(
-            user=settings.DB_USER,
-            password=settings.DB_PASSWORD,
-            database=settings.DB_NAME,
-            host=settings.DB_HOST,
-            port=settings.DB_PORT,
-            min_size=5,
-            max_size=20,
-            command_timeout=60,
-        )
-        logger.info("Pool de conexões estabelecido com sucesso")
-    except Exception as e:
-        logger.critical(f"Falha ao criar pool de conexões: {e}", exc_info=True)
-        raise
-
-    # 1.2. Inicialização do Google Earth Engine
-    try:
-        initialize_earth_engine()
-        logger.info("Google Earth Engine inicializado com sucesso")
-    except Exception as e:
-        logger.critical(f"Falha ao inicializar Google Earth Engine: {e}", exc_info=True)
-        raise
-
-    yield
-
-    # 1.3. Encerramento
-    logger.info("Encerrando servidor...")
-    if hasattr(app.state, 'pool') and app.state.pool:
-        await app.state.pool.close()
-        logger.info("Pool de conexões fechado")
-
-templates = Jinja2Templates(directory="static")
+        # 1.1. Inicialização do banco de dados
+        logger.info("Criando pool de conexões com o banco de dados...")
+        try:
+            app.state.pool = await asyncpg.create_pool(
+                user=settings.DB_USER,
+                password=settings.DB_PASSWORD,
+                database=settings.DB_NAME,
+                host=settings.DB_HOST,
+                port=settings.DB_PORT,
+                min_size=settings.DB_POOL_MIN,
+                max_size=settings.DB_POOL_MAX,
+                max_inactive_connection_lifetime=300,
+                max_queries=50_000,
+                command_timeout=60,
+                statement_cache_size=1024,
+                connection_class=PreparedConnection,
+                init=init_connection,
+            )
+            await warm_up_pool(app.state.pool, settings.DB_POOL_MIN)
+            # Os decoradores with_db_connection usam o mesmo pool
+            set_pool(app.state.pool)
+            # O sub-app de análise não herda o 'state' do app principal
+            analysis_app.state.pool = app.state.pool
+            logger.info("Pool de conexões estabelecido com sucesso")
+        except Exception as e:
+            logger.critical(f"Falha ao criar pool de conexões: {e}", exc_info=True)
+            raise
+
+        # 1.2. Inicialização do Google Earth Engine
+        try:
+            initialize_earth_engine()
+            logger.info("Google Earth Engine inicializado com sucesso")
+        except Exception as e:
+            logger.critical(f"Falha ao inicializar Google Earth Engine: {e}", exc_info=True)
+            raise
+
+        yield
+    finally:
+        # 1.3. Encerramento (também quando a inicialização falha após criar o pool)
+        logger.info("Encerrando servidor...")
+        await close_http_session()
+        set_pool(None)
+        pool = getattr(app.state, 'pool', None)
+        if pool is not None:
+            try:
+                await asyncio.wait_for(pool.close(), timeout=5.0)
+                logger.info("Pool de conexões fechado")
+            except asyncio.TimeoutError:
+                logger.warning("Pool não fechou em 5s; encerrando conexões à força")
+                pool.terminate()
+
+@pass_context
+def _url_for(context, name: str, **path_params) -> str:
+    """Equivalente ao url_for do Jinja2Templates, resolvido a partir do 'request' do contexto."""
+    return context["request"].url_for(name, **path_params)
+
+# Ambiente Jinja próprio: as páginas só interpolam URLs geradas pelo url_for,
+# então o autoescape é desligado; auto_reload=False evita o stat() do template
+# a cada uso e cache_size=-1 mantém todos os templates compilados.
+templates = Environment(
+    loader=FileSystemLoader("static"),
+    autoescape=False,
+    auto_reload=False,
+    cache_size=-1,
+)
+templates.globals["url_for"] = _url_for
+
+# Compila as páginas na importação, antes do fork dos workers
+for _template_name in ("login.html", "dashboard.html", "settings.html"):
+    templates.get_template(_template_name)
+
+# HTML já renderizado por (template, base_url). As páginas só dependem do
+# 'request' para o url_for, que gera URLs absolutas a partir do host da requisição.
+_rendered_pages = {}
+MAX_RENDERED_PAGES = 64
+
+def render_page(request: Request, name: str) -> HTMLResponse:
+    """Renderiza a página uma vez por host e serve o HTML em cache nas demais requisições."""
+    key = (name, str(request.base_url))
+    html = _rendered_pages.get(key)
+    if html is None:
+        html = templates.get_template(name).render({"request": request})
+        # Limita o cache para que cabeçalhos Host arbitrários não cresçam a memória
+        if len(_rendered_pages) < MAX_RENDERED_PAGES:
+            _rendered_pages[key] = html
+    return HTMLResponse(html)
 
 # 2. Criação do app FastAPI
+# Produção: gunicorn -w 4 -k uvicorn.workers.UvicornWorker --worker-connections 1000 app:app
+# Com uvloop e httptools instalados, o uvicorn ("auto") usa ambos no lugar do
+# asyncio padrão e do h11; localmente: uvicorn app:app --loop uvloop --http httptools
 app = FastAPI(
     title="Portal Multiespectral - Refatorado",
     version="1.0.0",
@@ -85,57 +154,68 @@ allowed_origins = [
     "https://seu-dominio-de-producao.com",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
+cors_options = dict(
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
-#app.add_middleware(TokenRefreshMiddleware)
+
+if settings.CORS_ENABLED:
+    app.add_middleware(CachedCORSMiddleware, **cors_options)
+app.add_middleware(TokenRefreshMiddleware)
+
+# 3. Sub-app de análise: só o próprio CORS, sem TokenRefreshMiddleware.
+# Os jobs de análise são longos e não se beneficiam da renovação do token.
+# O SubAppDispatchMiddleware (o mais externo) desvia /api/v1/analysis antes da
+# pilha do app principal, então o CORS roda uma única vez, no sub-app.
+analysis_app = FastAPI(
+    title="Portal Multiespectral - Análise",
+    version="1.0.0",
+)
+if settings.CORS_ENABLED:
+    analysis_app.add_middleware(CachedCORSMiddleware, **cors_options)
+analysis_app.include_router(analysis_router, tags=["Análise de TCH & ATR"])
+app.add_middleware(SubAppDispatchMiddleware, path="/api/v1/analysis", sub_app=analysis_app)
 
 # 4. Rotas da API
 app.include_router(auth_router, prefix="/api/v1/auth", tags=["Autenticação"])
 app.include_router(users_router, prefix="/api/v1/users", tags=["Usuários"])
 app.include_router(roi_router, prefix="/api/v1/roi", tags=["Regiões de Interesse"])
 app.include_router(harvest_router, prefix="/api/v1/harvest", tags=["Programação de Colheita"])
-app.include_router(analysis_router, prefix="/api/v1/analysis", tags=["Análise de TCH & ATR"])
 app.include_router(models_router, prefix="/api/v1/models", tags=["Modelos de Análise"])
 app.include_router(reports_router)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # 6. Rotas de Página (Frontend)
 @app.get("/", response_class=HTMLResponse, tags=["Frontend"])
 async def get_login_page(request: Request):
     """Serve a página de login na rota raiz."""
-    return templates.TemplateResponse("login.html", {"request": request})
+    return render_page(request, "login.html")
 
 @app.get("/login", response_class=HTMLResponse, tags=["Frontend"])
 async def get_login_page_redirect(request: Request):
     """Serve a página de login para compatibilidade."""
-    return templates.TemplateResponse("login.html", {"request": request})
+    return render_page(request, "login.html")
 
 @app.get("/dashboard", response_class=HTMLResponse, tags=["Frontend"])
 async def get_dashboard_page(request: Request):
     """Serve a página do dashboard usando templates."""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return render_page(request, "dashboard.html")
 
 @app.get("/settings", response_class=HTMLResponse, tags=["Frontend"])
 async def get_settings_page(request: Request):
     """Serve a página de configurações usando templates."""
-    return templates.TemplateResponse("settings.html", {"request": request})
+    return render_page(request, "settings.html")
 
 @app.get("/test-reports", response_class=HTMLResponse, tags=["Frontend"])
 async def get_report_test_page(request: Request):
     """Serve a página de teste de relatórios."""
-    return templates.TemplateResponse("test_report.html", {"request": request})
+    return render_page(request, "test_report.html")
 
 @app.get("/harvesting", response_class=HTMLResponse, tags=["Frontend"])
 async def get_harvesting_page(request: Request):
     """Serve a página de gerenciamento de colheita."""
-    return templates.TemplateResponse("harvesting.html", {"request": request})
-    
-# Esta linha faz o FastAPI servir arquivos estáticos de forma redundante.
-# O Nginx já lida com isso. Comente-a para evitar conflitos.
-#app.mount("/", StaticFiles(directory="static"), name="static")
+    return render_page(request, "harvesting.html")
+
@@ -1,32 +1,43 @@
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 # Garante que o .env seja carregado
 load_dotenv()
 
 
+def _env_int(name: str, default: int) -> int:
+    """Lê um inteiro do ambiente, usando o padrão quando a variável não existe."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+@dataclass(frozen=True)
 class Settings:
     """
     Centraliza todas as configurações da aplicação lidas a partir
-    de variáveis de ambiente.
+    de variáveis de ambiente. Imutável após a criação; todos os
+    inteiros têm padrão para que a importação não falhe sem o .env.
     """
     # --- Configurações do Banco de Dados ---
     DB_USER: str = os.getenv("DB_USER")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD")
     DB_NAME: str = os.getenv("DB_NAME")
     DB_HOST: str = os.getenv("DB_HOST", "localhost")
-    DB_PORT: int = int(os.getenv("DB_PORT", "5432"))
+    DB_PORT: int = _env_int("DB_PORT", 5432)
+    DB_POOL_MAX: int = _env_int("DB_POOL_MAX", 50)
+    DB_POOL_MIN: int = _env_int("DB_POOL_MIN", DB_POOL_MAX // 2)
 
     SECRET_KEY: str = os.getenv("SECRET_KEY")
 
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
 
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(
-        os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-    REFRESH_TOKEN_EXPIRE_DAYS: int = int(
-        os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"))
-    REFRESH_THRESHOLD_MINUTES: int = int(
-        os.getenv("REFRESH_THRESHOLD_MINUTES"))
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = _env_int("ACCESS_TOKEN_EXPIRE_MINUTES", 30)
+    REFRESH_TOKEN_EXPIRE_DAYS: int = _env_int("REFRESH_TOKEN_EXPIRE_DAYS", 7)
+    REFRESH_THRESHOLD_MINUTES: int = _env_int("REFRESH_THRESHOLD_MINUTES", 5)
+
+    # Desative (CORS_ENABLED=0) quando o Nginx já injeta os cabeçalhos CORS
+    CORS_ENABLED: bool = os.getenv("CORS_ENABLED", "1") == "1"
 
     # --- Configurações do Google Earth Engine ---
     EE_PROJECT: str = os.getenv("EE_PROJECT")
@@ -34,9 +45,8 @@ class Settings:
     DEFAULT_SERVICE_ACCOUNT: str = os.getenv("DEFAULT_SERVICE_ACCOUNT")
 
     # --- Configurações de Segurança Adicionais (Opcionais) ---
-    MAX_LOGIN_ATTEMPTS: int = int(os.getenv("MAX_LOGIN_ATTEMPTS"))
-    ACCOUNT_LOCK_TIME_MINUTES: int = int(
-        os.getenv("ACCOUNT_LOCK_TIME_MINUTES"))
+    MAX_LOGIN_ATTEMPTS: int = _env_int("MAX_LOGIN_ATTEMPTS", 5)
+    ACCOUNT_LOCK_TIME_MINUTES: int = _env_int("ACCOUNT_LOCK_TIME_MINUTES", 15)
 
     # --- Campos Opcionais do JWT (se utilizados) ---
     JWT_ISSUER: str = os.getenv("JWT_ISSUER")
@@ -1,13 +1,18 @@
+import asyncio
 import asyncpg
 import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
 from config import settings
 from functools import wraps
-from config import settings
-from utils.exception_utils import handle_exceptions
+from shapely import wkb
+from utils.json_utils import json_dumps_bytes, json_loads
 from fastapi import Request, Depends, HTTPException
 
 logger = logging.getLogger(__name__)
 
+DBFunc = TypeVar('DBFunc', bound=Callable[..., Awaitable[Any]])
+
 DB_CONFIG = {
     "user": settings.DB_USER,
     "password": settings.DB_PASSWORD,
@@ -17,53 +22,184 @@ DB_CONFIG = {
     "command_timeout": 60
 }
 
-def with_db_connection(func):
+# Statements preparados uma única vez em cada conexão do pool (nome -> SQL).
+# Os módulos de queries registram seus statements na importação.
+PREPARED_STATEMENTS: Dict[str, str] = {}
+
+
+def register_statement(name: str, sql: str) -> str:
+    """Registra um statement para ser preparado na inicialização das conexões do pool."""
+    PREPARED_STATEMENTS[name] = sql
+    return sql
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Conexão do pool que guarda os statements registrados já preparados."""
+    __slots__ = ('prepared',)
+
+
+def _geometry_to_ewkb(geometry) -> bytes:
+    """Serializa uma geometria Shapely como EWKB em EPSG:4326, o SRID da coluna 'geometria'."""
+    return wkb.dumps(geometry, srid=4326)
+
+
+async def register_codecs(conn: asyncpg.Connection):
     """
-    Decorador para gerenciar a conexão com o banco de dados.
-    Preserva a assinatura original da função para o FastAPI.
+    Registra os codecs binários de jsonb e json: dicts são enviados direto como
+    bytes (no jsonb, versão 1 do formato binário + JSON), sem json.dumps no
+    Python nem parse de texto no Postgres. Na leitura, colunas jsonb e json
+    (ex.: ST_AsGeoJSON(...)::json) já chegam como dict.
+
+    Colunas 'geometry' do PostGIS trafegam em WKB binário e chegam como
+    geometrias Shapely, sem ST_GeomFromGeoJSON/ST_AsGeoJSON no servidor.
+    """
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=lambda value: b'\x01' + json_dumps_bytes(value),
+        decoder=lambda value: json_loads(value[1:]),
+        schema='pg_catalog',
+        format='binary'
+    )
+    await conn.set_type_codec(
+        'json',
+        encoder=json_dumps_bytes,
+        decoder=json_loads,
+        schema='pg_catalog',
+        format='binary'
+    )
+    await conn.set_type_codec(
+        'geometry',
+        encoder=_geometry_to_ewkb,
+        decoder=wkb.loads,
+        schema='public',
+        format='binary'
+    )
+
+
+async def init_connection(conn: PreparedConnection):
+    """
+    Callback 'init' do pool: registra os codecs e prepara todos os statements
+    registrados, amortizando o parse/plan por toda a vida da conexão.
+    """
+    await register_codecs(conn)
+    conn.prepared = {
+        name: await conn.prepare(sql) for name, sql in PREPARED_STATEMENTS.items()
+    }
+
+
+async def get_statement(conn, name: str) -> asyncpg.prepared_stmt.PreparedStatement:
+    """
+    Retorna o statement preparado da conexão. Conexões abertas fora do pool
+    (sem o callback 'init') preparam o statement na hora.
+    """
+    prepared = getattr(conn, 'prepared', None)
+    if prepared and name in prepared:
+        return prepared[name]
+    return await conn.prepare(PREPARED_STATEMENTS[name])
+
+
+# Último instante (time.monotonic) em que o traceback de cada classe de erro foi registrado
+_last_traceback_logged: Dict[str, float] = {}
+TRACEBACK_LOG_INTERVAL = 1.0
+
+
+def _log_db_error(exc: Exception, func_name: str, prefix: str = "") -> None:
+    """
+    Registra o erro de uma função de banco. O traceback completo é formatado
+    no máximo uma vez por segundo por classe de erro; numa falha em massa
+    (ex.: banco fora do ar) as demais ocorrências registram só a mensagem.
     """
+    error_class = type(exc).__name__
+    now = time.monotonic()
+    if now - _last_traceback_logged.get(error_class, float('-inf')) < TRACEBACK_LOG_INTERVAL:
+        logger.error("%s%s: %s (traceback suprimido)", prefix, func_name, exc)
+        return
+    _last_traceback_logged[error_class] = now
+    logger.error("%s%s: %s", prefix, func_name, exc, exc_info=True)
+
+
+# Pool compartilhado pelos decoradores. O lifespan registra o pool da
+# aplicação com set_pool; fora dele (scripts, workers) o pool é criado no primeiro uso.
+_pool: Optional[asyncpg.Pool] = None
+# Criado sob demanda: no Python 3.8/3.9 o Lock se prende ao loop da criação
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+def set_pool(pool: Optional[asyncpg.Pool]):
+    """Define o pool usado pelos decoradores (None ao encerrar a aplicação)."""
+    global _pool
+    _pool = pool
+
+
+async def get_or_create_pool() -> asyncpg.Pool:
+    """Retorna o pool compartilhado, criando-o na primeira chamada."""
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    **DB_CONFIG,
+                    min_size=min(10, settings.DB_POOL_MAX),
+                    max_size=settings.DB_POOL_MAX,
+                    statement_cache_size=1024,
+                    connection_class=PreparedConnection,
+                    init=init_connection,
+                )
+                logger.info("Pool de conexões dos decoradores criado")
+    return _pool
+
+
+def _wrap_db_function(func: DBFunc, *, background: bool) -> DBFunc:
+    """
+    Implementação única dos decoradores de conexão. Todo o tratamento (conexão
+    explícita ou do pool, log amostrado e conversão do erro) fica em um único
+    wrapper, para que cada chamada ao banco custe apenas um frame extra.
+    """
+    log_prefix = "BG Task: " if background else ""
+
     @wraps(func)
-    @handle_exceptions
-    async def wrapper(*args, **kwargs):
-        conn = None
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
         try:
-            conn = await asyncpg.connect(**DB_CONFIG)
-            logger.info("Conexão estabelecida")
-            # Injetando conn como primeiro argumento
-            result = await func(conn, *args, **kwargs)
-            logger.info("Operação concluída")
-            return result
-        except Exception as e:
-            logger.error(f"Erro: {str(e)}")
+            conn = kwargs.pop('conn', None)
+            if conn is not None:
+                return await func(conn, *args, **kwargs)
+            pool = _pool or await get_or_create_pool()
+            async with pool.acquire() as conn:
+                # Injetando conn como primeiro argumento
+                return await func(conn, *args, **kwargs)
+        except HTTPException:
             raise
-        finally:
-            if conn:
-                await conn.close()
-                logger.info("Conexão fechada")
+        except Exception as e:
+            _log_db_error(e, func.__name__, prefix=log_prefix)
+            if background:
+                raise  # Relança a exceção original para ser tratada pela tarefa
+            raise HTTPException(
+                status_code=400, detail=f"Erro ao processar a requisição: {str(e)}"
+            )
     return wrapper
 
-def with_db_connection_bg(func):
+
+def with_db_connection(func: DBFunc) -> DBFunc:
+    """
+    Decorador para gerenciar a conexão com o banco de dados.
+    Preserva a assinatura original da função para o FastAPI.
+
+    A conexão vem do pool compartilhado; quem já tem uma conexão (ex.: dentro
+    de uma transação) pode passá-la como 'conn=' e ela é usada diretamente.
+    Erros são convertidos em HTTPException(400).
+    """
+    return _wrap_db_function(func, background=False)
+
+
+def with_db_connection_bg(func: DBFunc) -> DBFunc:
     """
     Decorador de conexão com o DB para tarefas em background.
     Não lança HTTPException, apenas registra o erro e o relança.
     """
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        conn = None
-        try:
-            conn = await asyncpg.connect(**DB_CONFIG)
-            logger.info("BG Task: Conexão estabelecida")
-            result = await func(conn, *args, **kwargs)
-            logger.info("BG Task: Operação concluída")
-            return result
-        except Exception as e:
-            logger.error(f"BG Task: Erro de banco de dados: {str(e)}", exc_info=True)
-            raise  # Relança a exceção original para ser tratada pela tarefa
-        finally:
-            if conn:
-                await conn.close()
-                logger.info("BG Task: Conexão fechada")
-    return wrapper
+    return _wrap_db_function(func, background=True)
+
 
 async def get_db_connection(request: Request) -> asyncpg.Connection:
     """
@@ -79,11 +215,11 @@ async def get_db_connection(request: Request) -> asyncpg.Connection:
 
     # Adquire uma conexão do pool
     conn = await pool.acquire()
-    logger.info(f"Conexão {id(conn)} adquirida do pool.")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Conexão %s adquirida do pool.", id(conn))
     try:
         # Disponibiliza a conexão para a rota
         yield conn
     finally:
         # Libera a conexão de volta para o pool quando a requisição termina
-        await pool.release(conn)
-        logger.info(f"Conexão {id(conn)} liberada de volta para o pool.")
\ No newline at end of file
+        await pool.release(conn)
\ No newline at end of file
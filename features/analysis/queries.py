@@ -1,81 +1,103 @@
 import logging
-import json
-from datetime import datetime
+from datetime import date
 import asyncpg
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
-from database.session import with_db_connection, with_db_connection_bg
+from database.session import with_db_connection, with_db_connection_bg, register_statement, get_statement
 
 logger = logging.getLogger(__name__)
 
-@with_db_connection
-async def create_analysis_job(conn, *, user_id: int, roi_id: Optional[int] = None, parent_job_id: Optional[int] = None) -> int:
-    """Cria um novo registro de job de análise e retorna o ID."""
-    query = "INSERT INTO analysis_jobs (user_id, roi_id, parent_job_id) VALUES ($1, $2, $3) RETURNING job_id"
-    job_id = await conn.fetchval(query, user_id, roi_id, parent_job_id)
-    if parent_job_id:
-        logger.info(f"Criado job de análise filho com ID: {job_id} para o ROI {roi_id}, filho de {parent_job_id}.")
-    else:
-        logger.info(f"Criado job de análise pai com ID: {job_id} para o usuário {user_id}.")
-    return job_id
+# --- Statements preparados uma vez por conexão do pool ---
+register_statement("create_analysis_job", """
+    INSERT INTO analysis_jobs (user_id, roi_id, parent_job_id, input_path) VALUES ($1, $2, $3, $4) RETURNING job_id
+""")
+
+register_statement("update_analysis_job_status", """
+    UPDATE analysis_jobs
+    SET status = $2,
+        completed_at = CASE WHEN $2 = ANY(ARRAY['COMPLETED', 'FAILED']) THEN CURRENT_TIMESTAMP END,
+        error_message = $3
+    WHERE job_id = $1
+""")
+
+register_statement("create_analysis_jobs_batch", """
+    INSERT INTO analysis_jobs (user_id, roi_id, parent_job_id)
+    SELECT $1, roi_id, $2 FROM unnest($3::int[]) AS roi_id
+    RETURNING job_id, roi_id
+""")
+
+register_statement("update_analysis_jobs_status_batch", """
+    UPDATE analysis_jobs AS j
+    SET status = v.status,
+        completed_at = CASE WHEN v.status = ANY(ARRAY['COMPLETED', 'FAILED']) THEN CURRENT_TIMESTAMP END,
+        error_message = v.error_message
+    FROM unnest($1::int[], $2::text[], $3::text[]) AS v(job_id, status, error_message)
+    WHERE j.job_id = v.job_id
+""")
 
 @with_db_connection
 async def update_job_status(conn, *, job_id: int, status: str, error_message: str = None):
     """Atualiza o status e a data de conclusão de um job."""
-    completed_at = datetime.now() if status in ['COMPLETED', 'FAILED'] else None
-    query = """
-        UPDATE analysis_jobs
-        SET status = $2, completed_at = $3, error_message = $4
-        WHERE job_id = $1
-    """
-    await conn.execute(query, job_id, status, completed_at, error_message)
+    stmt = await get_statement(conn, "update_analysis_job_status")
+    await stmt.fetchval(job_id, status, error_message)
     logger.info(f"Status do job {job_id} atualizado para: {status}")
 
 @with_db_connection
 async def save_analysis_results(conn, *, job_id: int, results: List[Dict]):
     """Salva os resultados de predição para um job."""
-    query = "INSERT INTO analysis_results (job_id, date_analyzed, predicted_atr) VALUES ($1, $2, $3)"
-    await conn.executemany(query, [(job_id, r['date_analyzed'], r['predicted_atr']) for r in results])
+    # COPY binário: todas as linhas em um único fluxo, sem parse/plan por linha
+    await conn.copy_records_to_table(
+        'analysis_results',
+        records=((job_id, r['date_analyzed'], float(r['predicted_atr'])) for r in results),
+        columns=('job_id', 'date_analyzed', 'predicted_atr')
+    )
     logger.info(f"Salvos {len(results)} resultados para o job {job_id}.")
 
+def _results_from_jsonb(results: List[Dict]) -> List[Dict]:
+    """
+    O jsonb_agg serializa 'date_analyzed' como string ISO; devolve-o como
+    datetime.date, o tipo que a coluna tem e que os consumidores (ex.: o
+    gerador de relatórios, que chama strftime) esperam.
+    """
+    for result in results:
+        if isinstance(result.get('date_analyzed'), str):
+            result['date_analyzed'] = date.fromisoformat(result['date_analyzed'])
+    return results
+
 @with_db_connection
 async def get_job_with_results(conn, *, job_id: int, user_id: int) -> Optional[Dict]:
     """
     Busca um job e seus resultados. Se for um job pai, busca também todos os jobs filhos
     e seus respectivos resultados de forma otimizada.
     """
-    # 1. Buscar o job principal (pai) e todos os seus filhos diretos em uma única query
+    # 1. Buscar o job principal (pai), seus filhos diretos e os resultados de
+    #    cada um, já agregados pelo Postgres, em uma única query
     all_jobs_query = """
-        SELECT job_id, roi_id, status, created_at, completed_at, error_message, parent_job_id
-        FROM analysis_jobs
-        WHERE (job_id = $1 AND user_id = $2) OR (parent_job_id = $1 AND user_id = $2)
-        ORDER BY parent_job_id NULLS FIRST, job_id; -- Garante que o pai venha primeiro
+        SELECT j.job_id, j.roi_id, j.status, j.created_at, j.completed_at, j.error_message, j.parent_job_id, j.input_path,
+               COALESCE((
+                   SELECT jsonb_agg(jsonb_build_object(
+                              'job_id', r.job_id,
+                              'date_analyzed', r.date_analyzed,
+                              'predicted_atr', r.predicted_atr
+                          ) ORDER BY r.date_analyzed)
+                   FROM analysis_results r
+                   WHERE r.job_id = j.job_id
+               ), '[]'::jsonb) AS results
+        FROM analysis_jobs j
+        WHERE (j.job_id = $1 OR j.parent_job_id = $1) AND j.user_id = $2
+        ORDER BY j.parent_job_id NULLS FIRST, j.job_id; -- Garante que o pai venha primeiro
     """
     all_job_records = await conn.fetch(all_jobs_query, job_id, user_id)
 
     if not all_job_records:
         return None
 
-    all_job_ids = [j['job_id'] for j in all_job_records]
-
-    # 2. Buscar todos os resultados para todos os jobs encontrados de uma vez
-    results_query = "SELECT job_id, date_analyzed, predicted_atr FROM analysis_results WHERE job_id = ANY($1::int[]) ORDER BY date_analyzed"
-    all_results_records = await conn.fetch(results_query, all_job_ids)
-
-    # 3. Mapear resultados por job_id para fácil acesso
-    results_map = {}
-    for res in all_results_records:
-        res_job_id = res['job_id']
-        if res_job_id not in results_map:
-            results_map[res_job_id] = []
-        results_map[res_job_id].append(dict(res))
-
-    # 4. Montar a estrutura hierárquica
+    # 2. Montar a estrutura hierárquica
     job_map = {j['job_id']: dict(j) for j in all_job_records}
     root_job = None
 
     for j_id, job_data in job_map.items():
-        job_data['results'] = results_map.get(j_id, [])
+        job_data['results'] = _results_from_jsonb(job_data['results'])
         job_data['child_jobs'] = [] # Inicializa a lista de filhos
 
         parent_id = job_data.get('parent_job_id')
@@ -87,17 +109,41 @@ async def get_job_with_results(conn, *, job_id: int, user_id: int) -> Optional[D
     return root_job
 
 @with_db_connection_bg
-async def create_analysis_job(conn: asyncpg.Connection, user_id: int, roi_id: Optional[int], parent_job_id: Optional[int] = None) -> int:
-    """Cria um novo registro de job de análise (seguro para background)."""
-    query = "INSERT INTO analysis_jobs (user_id, roi_id) VALUES ($1, $2) RETURNING job_id"
-    job_id = await conn.fetchval(query, user_id, roi_id)
-    logger.info(f"BG Task: Criado job de análise com ID: {job_id} para o usuário {user_id} e ROI {roi_id}.")
+async def create_analysis_job(conn: asyncpg.Connection, user_id: int, roi_id: Optional[int], parent_job_id: Optional[int] = None, input_path: Optional[str] = None) -> int:
+    """
+    Cria um novo registro de job de análise e retorna o ID (seguro para background).
+    'input_path' é o arquivo de entrada do job (ex.: o ZIP enviado), usado
+    depois pelo serviço de relatórios para localizar as bandas.
+    """
+    stmt = await get_statement(conn, "create_analysis_job")
+    job_id = await stmt.fetchval(user_id, roi_id, parent_job_id, input_path)
+    if parent_job_id:
+        logger.info(f"BG Task: Criado job de análise filho com ID: {job_id} para o ROI {roi_id}, filho de {parent_job_id}.")
+    else:
+        logger.info(f"BG Task: Criado job de análise pai com ID: {job_id} para o usuário {user_id}.")
     return job_id
 
 @with_db_connection_bg
 async def update_job_status_bg(conn, *, job_id: int, status: str, error_message: str = None):
     """Atualiza o status de um job (seguro para background)."""
-    completed_at = datetime.now() if status in ['COMPLETED', 'FAILED'] else None
-    query = "UPDATE analysis_jobs SET status = $2, completed_at = $3, error_message = $4 WHERE job_id = $1"
-    await conn.execute(query, job_id, status, completed_at, error_message)
-    logger.info(f"BG Task: Status do job {job_id} atualizado para: {status}")
\ No newline at end of file
+    stmt = await get_statement(conn, "update_analysis_job_status")
+    await stmt.fetchval(job_id, status, error_message)
+    logger.info(f"BG Task: Status do job {job_id} atualizado para: {status}")
+
+@with_db_connection_bg
+async def create_analysis_jobs_batch(conn: asyncpg.Connection, *, user_id: int, parent_job_id: int, roi_ids: List[int]) -> Dict[int, int]:
+    """Cria os jobs filhos de todas as ROIs em um único INSERT e retorna {roi_id: job_id}."""
+    stmt = await get_statement(conn, "create_analysis_jobs_batch")
+    rows = await stmt.fetch(user_id, parent_job_id, roi_ids)
+    logger.info(f"BG Task: Criados {len(rows)} jobs de análise filhos de {parent_job_id}.")
+    return {row['roi_id']: row['job_id'] for row in rows}
+
+@with_db_connection_bg
+async def update_jobs_status_batch(conn, *, updates: List[Tuple[int, str, Optional[str]]]):
+    """Aplica vários (job_id, status, error_message) em um único UPDATE (seguro para background)."""
+    if not updates:
+        return
+    job_ids, statuses, error_messages = zip(*updates)
+    stmt = await get_statement(conn, "update_analysis_jobs_status_batch")
+    await stmt.fetchval(list(job_ids), list(statuses), list(error_messages))
+    logger.info(f"BG Task: Status de {len(updates)} jobs atualizado.")
@@ -1,141 +1,192 @@
+import asyncio
+import functools
 import logging
+import os
 import shutil
 import zipfile
-from datetime import datetime
+from datetime import date
 from pathlib import Path
 import re
 from collections import defaultdict
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
 import asyncpg
 
 from fastapi import (APIRouter, BackgroundTasks, Depends, File, Form,
                      HTTPException, UploadFile, status)
 
 from features.auth.dependencies import get_current_user
-from features.roi.queries import listar_rois_por_ids_para_batch
+from features.roi.queries import iterar_rois_por_ids_para_batch
 
 from features.models import queries as model_queries
-from database.session import get_db_connection, DB_CONFIG
+from database.session import get_db_connection, get_or_create_pool
 
 from services.shapefile_service import convert_3d_to_2d
-from utils.upload_utils import cleanup_temp_files, save_uploaded_files
+from utils.upload_utils import cleanup_temp_files, save_uploaded_files_async
 from . import queries, schemas
 from .service import analysis_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Padrão de arquivo que inclui o roi_id: sentinel2_{roi_id}_{data}_{banda}.tif
+_FILE_PATTERN_MULTI = re.compile(
+    r'sentinel2_(\d+)_(\d{4}-\d{2}-\d{2})_(B\d+A?)\.tif$')
+
+
+def _is_safe_zip(name: Optional[str]) -> bool:
+    """Nome de upload aceito: termina em .zip e não contém separadores de caminho."""
+    return bool(name) and name.endswith('.zip') and '/' not in name and '\\' not in name
+
+
+def _index_band_files(zip_path: Path) -> Dict[int, Dict[str, Dict[str, str]]]:
+    """
+    Agrupa as bandas do ZIP por ROI e por data, sem extraí-las.
+
+    Os caminhos usam o prefixo '/vsizip/' do GDAL: o rasterio lê cada .tif
+    direto de dentro do ZIP, descompactando sob demanda, sem gravar cópias
+    em disco.
+    """
+    archive = zip_path.resolve()
+    files_by_roi_and_date = defaultdict(lambda: defaultdict(dict))
+    with zipfile.ZipFile(archive, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            name = info.filename
+            # Filtro literal barato antes da regex: nomes sem '_B' nunca casam
+            if info.is_dir() or '_B' not in name:
+                continue
+            match = _FILE_PATTERN_MULTI.search(name.rsplit('/', 1)[-1])
+            if match:
+                roi_id_str, date_str, band_name = match.groups()
+                files_by_roi_and_date[int(roi_id_str)][date_str][band_name] = f"/vsizip/{archive}/{name}"
+    return files_by_roi_and_date
+
 
 async def run_multi_roi_analysis_in_background(
     parent_job_id: int,
     zip_path: Path,
     user_id: int,
-    modelo_id: int,
-    db_config: dict
+    modelo_id: int
 ):
     """
     Função em background que processa um .zip contendo imagens de múltiplos talhões.
     AGORA CARREGA O MODELO ESPECIFICADO.
     """
-    analysis_dir = zip_path.parent / f"analysis_{parent_job_id}"
-    conn = None  # Conexão do DB para a tarefa
+    pool = None
+    conn = None  # Conexão do DB para a tarefa (emprestada do pool)
     model_artifacts = None  # Artefatos do modelo
+    executor = None  # Threads do pipeline de análise
 
     try:
         logger.info(
             f"[Job Pai {parent_job_id}] Iniciando tarefa de análise em lote.")
 
-        # Conecta ao DB dentro da tarefa
-        conn = await asyncpg.connect(**db_config)
+        # Empresta uma conexão do pool da aplicação; os codecs e statements
+        # preparados já vêm registrados pelo init do pool
+        pool = await get_or_create_pool()
+        conn = await pool.acquire()
 
         await queries.update_job_status(job_id=parent_job_id, status="PROCESSING", conn=conn)
 
         # 1. Carregar artefatos do modelo
         logger.info(
             f"[Job Pai {parent_job_id}] Carregando artefatos do modelo ID: {modelo_id}")
-        model_paths = await model_queries.get_model_paths(conn, modelo_id)
-        if not model_paths:
+        model_artifacts = await model_queries.get_model_artifacts(conn, modelo_id)
+        if not model_artifacts:
             raise ValueError(
                 f"Modelo ID {modelo_id} não encontrado ou inativo.")
-
-        # Esta é uma operação síncrona de I/O de disco
-        model_artifacts = await model_queries.load_model_artifacts_from_paths(model_paths)
         logger.info(
             f"[Job Pai {parent_job_id}] Artefatos do modelo carregados com sucesso.")
 
-        # 2. Descompactar arquivos
-        analysis_dir.mkdir(parents=True, exist_ok=True)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(analysis_dir)
-
-        logger.info(f"[Job Pai {parent_job_id}] Arquivo descompactado em: {analysis_dir}")
-
-        # Padrão de arquivo que inclui o roi_id
-        file_pattern = re.compile(
-            r'sentinel2_(\d+)_(\d{4}-\d{2}-\d{2})_(B\d+A?)\.tif$')
+        # 2. Indexar as bandas do ZIP (leitura do diretório central em thread)
+        files_by_roi_and_date = await asyncio.get_running_loop().run_in_executor(
+            None, _index_band_files, zip_path)
 
-        # Estrutura para agrupar arquivos por ROI e depois por data
-        files_by_roi_and_date = defaultdict(lambda: defaultdict(dict))
-
-        for tif_path in analysis_dir.rglob('*.tif'):
-            match = file_pattern.search(tif_path.name)
-            if match:
-                roi_id_str, date_str, band_name = match.groups()
-                files_by_roi_and_date[int(roi_id_str)][date_str][band_name] = tif_path
-        
         if not files_by_roi_and_date:
             raise FileNotFoundError("Nenhum arquivo .tif com nome padronizado (sentinel2_{roi_id}_{data}_{banda}.tif) foi encontrado no ZIP.")
 
         # 3. Buscar metadados das ROIs
         all_roi_ids = list(files_by_roi_and_date.keys())
-        rois_data = await listar_rois_por_ids_para_batch(conn=conn, roi_ids=all_roi_ids, user_id=user_id)
-        rois_metadata_map = {roi['roi_id']: roi for roi in rois_data}
+        rois_metadata_map = {
+            roi['roi_id']: roi
+            async for roi in iterar_rois_por_ids_para_batch(conn, roi_ids=all_roi_ids, user_id=user_id)
+        }
 
-        # 4. Processar cada ROI
-        for roi_id, files_by_date in files_by_roi_and_date.items():
-    
-            child_job_id = await queries.create_analysis_job(user_id=user_id, roi_id=roi_id, parent_job_id=parent_job_id, conn=conn)
-            
-            try:
-                roi_meta = rois_metadata_map.get(roi_id)
-                if not roi_meta:
-                    raise ValueError(f"Metadados da ROI {roi_id} não encontrados ou não pertencem ao usuário.")
-                
-                # Extrai a área em hectares
-                metadata = roi_meta.get('metadata', {})
-                hectares = metadata.get('area_ha')
-                if hectares is None:
-                    raise ValueError(f"Não foi possível encontrar a área ('area_ha') nos metadados da ROI {roi_id}")
-
-                results_to_save = []
-                for date_str, band_paths_dict in files_by_date.items():
-                    logger.info(f"[Job Filho {child_job_id}] Processando data: {date_str} para ROI {roi_id}")
-    
-                    # 5. CHAMADA DE ANÁLISE (COM O MODELO CORRETO)
-                    analysis_result = analysis_service.run_analysis_pipeline(
-                        band_paths=band_paths_dict,
-                        hectares=hectares,
-                        model_artifacts=model_artifacts # <-- PASSA OS ARTEFATOS
-                    )
-              
-                    if analysis_result["status"] == "success":
-                        results_to_save.append({
-                            "date_analyzed": datetime.strptime(date_str, "%Y-%m-%d").date(),
-                            "predicted_atr": analysis_result["predicted_atr"]
-                        })
-
-                if results_to_save:
-                    await queries.save_analysis_results(job_id=child_job_id, results=results_to_save, conn=conn)
-                
-                await queries.update_job_status(job_id=child_job_id, status="COMPLETED", conn=conn)
-           
-                logger.info(f"[Job Filho {child_job_id}] Análise para ROI {roi_id} concluída com sucesso.")
-
-            except Exception as e:
-                logger.error(f"[Job Filho {child_job_id}] Erro na análise da ROI {roi_id}: {e}", exc_info=True)
-                await queries.update_job_status(job_id=child_job_id, status="FAILED", error_message=str(e), conn=conn)
-        
-        await queries.update_job_status(job_id=parent_job_id, status="COMPLETED", conn=conn)
+        # 4. Analisar todas as datas de todas as ROIs
+        # Os jobs filhos são criados em um único INSERT, e os status finais
+        # são acumulados e gravados em um único UPDATE ao fim
+        # Só ROIs encontradas ganham job filho: analysis_jobs.roi_id tem FK para
+        # regiao_de_interesse, e um id inexistente abortaria o INSERT inteiro.
+        # As ausentes (inexistentes ou de outro usuário) ficam na mensagem do pai.
+        missing_roi_ids = [roi_id for roi_id in all_roi_ids if roi_id not in rois_metadata_map]
+        if missing_roi_ids:
+            logger.warning(f"[Job Pai {parent_job_id}] {len(missing_roi_ids)} ROI(s) do ZIP sem metadados: {missing_roi_ids}")
+        child_job_ids = await queries.create_analysis_jobs_batch(
+            user_id=user_id, parent_job_id=parent_job_id, roi_ids=list(rois_metadata_map), conn=conn)
+        # ROIs sem área já entram como FAILED no UPDATE em lote, sem passar pela análise
+        child_statuses = []
+
+        rois_to_analyze = []
+        samples = []  # (roi_id, data, bandas, hectares), um por data de cada ROI
+        for roi_id, roi_meta in rois_metadata_map.items():
+            hectares = (roi_meta.get('metadata') or {}).get('area_ha')
+            if hectares is None:
+                message = f"Não foi possível encontrar a área ('area_ha') nos metadados da ROI {roi_id}"
+                logger.error(f"[Job Filho {child_job_ids[roi_id]}] {message}")
+                child_statuses.append((child_job_ids[roi_id], "FAILED", message))
+                continue
+            rois_to_analyze.append(roi_id)
+            for date_str, band_paths in files_by_roi_and_date[roi_id].items():
+                samples.append((roi_id, date_str, band_paths, hectares))
+
+        executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+        try:
+            # As features de cada data são extraídas em paralelo nas threads (as
+            # leituras do rasterio e o numpy liberam o GIL) e o modelo roda uma
+            # única vez sobre a matriz com as datas de todas as ROIs
+            logger.info(f"[Job Pai {parent_job_id}] Analisando {len(samples)} data(s) de {len(rois_to_analyze)} ROI(s)")
+            analysis_results = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    analysis_service.run_analysis_batch,
+                    [(band_paths, hectares) for _, _, band_paths, hectares in samples],
+                    model_artifacts,
+                    executor
+                )
+            )
+
+            results_by_roi = defaultdict(list)
+            for (roi_id, date_str, _, _), analysis_result in zip(samples, analysis_results):
+                if analysis_result["status"] == "success":
+                    results_by_roi[roi_id].append({
+                        "date_analyzed": date.fromisoformat(date_str),
+                        "predicted_atr": analysis_result["predicted_atr"]
+                    })
+
+            for roi_id in rois_to_analyze:
+                child_job_id = child_job_ids[roi_id]
+                try:
+                    results_to_save = results_by_roi.get(roi_id)
+                    if results_to_save:
+                        await queries.save_analysis_results(job_id=child_job_id, results=results_to_save, conn=conn)
+
+                    child_statuses.append((child_job_id, "COMPLETED", None))
+
+                    logger.info(f"[Job Filho {child_job_id}] Análise para ROI {roi_id} concluída com sucesso.")
+
+                except Exception as e:
+                    logger.error(f"[Job Filho {child_job_id}] Erro na análise da ROI {roi_id}: {e}", exc_info=True)
+                    child_statuses.append((child_job_id, "FAILED", str(e)))
+        finally:
+            await queries.update_jobs_status_batch(updates=child_statuses, conn=conn)
+
+        parent_message = None
+        if missing_roi_ids:
+            parent_message = (
+                f"ROI(s) do ZIP não encontradas ou que não pertencem ao usuário: "
+                f"{', '.join(map(str, missing_roi_ids))}")
+        await queries.update_job_status(
+            job_id=parent_job_id, status="COMPLETED", error_message=parent_message, conn=conn)
 
     except Exception as e:
  
@@ -148,10 +199,12 @@ async def run_multi_roi_analysis_in_background(
             logger.critical(f"[Job Pai {parent_job_id}] Falha crítica antes de salvar o status no DB.")
             
     finally:
-        # Garante que a conexão da tarefa seja fechada
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+        # Garante que a conexão da tarefa volte para o pool
         if conn:
-            await conn.close()
-            logger.info(f"[Job Pai {parent_job_id}] Conexão da tarefa background fechada.")
+            await pool.release(conn)
         
         # cleanup_temp_files(zip_path.parent)
         # logger.info(f"[Job Pai {parent_job_id}] Limpeza dos arquivos temporários concluída.")
@@ -178,35 +231,38 @@ async def upload_for_analysis(
     
     O ID do modelo selecionado pelo usuário é passado para a tarefa.
     """
-    if not file.filename.endswith('.zip'):
+    if not _is_safe_zip(file.filename):
         raise HTTPException(status_code=400, detail="O arquivo deve ser no formato .zip")
 
     try:
-        temp_zip_path = save_uploaded_files([file])
+        temp_zip_path = await save_uploaded_files_async([file])
+        zip_path = temp_zip_path / file.filename
 
         # Cria o job "pai" no banco de dados, sem roi_id
         # Precisamos passar a 'conn' que vem da dependência
+        # O caminho do ZIP fica no job: é por ele que o serviço de relatórios
+        # encontra as bandas (lidas direto do ZIP, sem extração)
         parent_job_id = await queries.create_analysis_job(
             user_id=current_user['id'], 
             roi_id=None,
             conn=conn,
-            parent_job_id=None
+            parent_job_id=None,
+            input_path=str(zip_path)
         )
 
         background_tasks.add_task(
             run_multi_roi_analysis_in_background,
             parent_job_id=parent_job_id,
-  
-           zip_path=temp_zip_path / file.filename,
+            zip_path=zip_path,
             user_id=current_user['id'],
-            modelo_id=modelo_id,
-            db_config=DB_CONFIG
+            modelo_id=modelo_id
         )
         
-        return {
-            "job_id": parent_job_id,
-            "message": "O job de análise em lote foi criado e está na fila para processamento."
-        }
+        # Valores já confiáveis (ID vindo do DB, mensagem fixa): dispensa a validação
+        return schemas.AnalysisJobResponse.model_construct(
+            job_id=parent_job_id,
+            message="O job de análise em lote foi criado e está na fila para processamento."
+        )
     
     except Exception as e:
         logger.error(f"Erro ao iniciar o job de upload para análise em lote: {e}", exc_info=True)
@@ -1,22 +1,93 @@
 import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple, Union
 
 import joblib
+import numexpr as ne
 import numpy as np
 import pandas as pd
 import rasterio
-from skimage.transform import resize
+from rasterio.enums import Resampling
 
 # Configurações do serviço de 
 class CFG:
     eps = 1e-6
     # Lista de bandas que o GEE deve baixar
     BANDS_TO_DOWNLOAD = ['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B8A', 'B09', 'B10', 'B11', 'B12']
+    # Pixels por bloco no cálculo dos índices (23 colunas float32 = 3 MiB)
+    INDEX_TILE_PIXELS = 1 << 15
 
 # Obtém o logger
 logger = logging.getLogger(__name__)
 
+# Leituras de bandas em paralelo: o GDAL libera o GIL ao decodificar e
+# reamostrar. Pool próprio, separado das threads que processam as datas.
+_band_read_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="band-read")
+
+
+def _read_band(src, target_shape) -> np.ndarray:
+    """Lê a banda 1 já no shape alvo, como float32, e a retorna achatada (sem cópia)."""
+    out = np.empty(target_shape, dtype=np.float32)
+    return src.read(1, out=out, resampling=Resampling.bilinear).ravel()
+
+
+# Fórmulas dos índices de vegetação, na ordem em que viram colunas
+_INDEX_FORMULAS = {
+    'NDVI': "(B08 - B04) / (B08 + B04 + eps)",
+    'GNDVI': "(B08 - B03) / (B08 + B03 + eps)",
+    'VARI': "(B03 - B04) / (B03 + B04 - B02 + eps)",
+    'ARVI': "(B08 - (2 * B04) + B02) / (B08 + (2 * B04) + B02 + eps)",
+    'NDWI': "(B03 - B08) / (B08 + B03 + eps)",
+    'NDMI': "(B08 - B11) / (B08 + B11 + eps)",
+    'SAVI': "(B08 - B11) / ((B08 + B11 + savi_l) * (1 + savi_l))",
+    'MSI': "B11 / (B8A + eps)",
+    'SIPI': "(B08 - B02) / (B08 - B04 + eps)",
+    'FIDET': "B12 / (B8A * B09 + eps)",
+    'NDRE': "(B09 - B05) / (B09 + B05 + eps)",
+    'brightness': "(" + " + ".join(f"abs({band})" for band in CFG.BANDS_TO_DOWNLOAD) + ") / 12",
+    'NGRDI': "(B03 - B04) / (B03 + B04 + eps)",
+    'RI': "(B04 / (B03 + eps)) - 1",
+    'GLI': "B03 / (B04 + B03 + B02 + eps)",
+    'VARIgreen': "(B03 - B04) / (B03 + B04 - B02 + eps)",
+    'CIVE': "(cive_r * B04) - (cive_g * B03) + (cive_b * B02) + cive_k",
+    'VEG': "((B04 - B02) * (B04 - B03)) ** 0.5 / (B04 + B02 + B03 + eps)",
+    'VDVI': "(B03 - B02) / (B03 + B02 + eps)",
+    'IAF': "B08 / (B04 + eps)",
+    'ExG': "2 * B03 - B04 - B02",
+    'ExGR': "(3 * B03 - exgr_r * B04 - exgr_n * B08) / (B03 + exgr_r * B04 + exgr_n * B08 + eps)",
+    'COM': "B08 / (B03 + eps)",
+}
+
+# Constantes não inteiras das fórmulas. Literais como 0.441 são double para o
+# numexpr e promoveriam o cálculo inteiro para float64; passadas como float32
+# em 'local_dict', mantêm todo o kernel em float32.
+_INDEX_CONSTANTS = {
+    name: np.float32(value)
+    for name, value in {
+        'eps': CFG.eps,
+        'savi_l': 0.55,
+        'cive_r': 0.441, 'cive_g': 0.811, 'cive_b': 0.385, 'cive_k': 18.78745,
+        'exgr_r': 2.4, 'exgr_n': 1.5,
+    }.items()
+}
+
+
+def _compile_index(formula: str):
+    """
+    Compila a fórmula uma única vez, com todas as entradas como float32.
+    Retorna o programa, os nomes das entradas (na ordem dos argumentos) e
+    se ele usa a VML.
+    """
+    names, ex_uses_vml = ne.necompiler.getExprNames(formula, {})
+    # No numexpr, o tipo 'float' do Python corresponde a float32
+    return ne.NumExpr(formula, [(name, float) for name in names]), names, ex_uses_vml
+
+
+# Programas já compilados: ne.evaluate refaria, a cada bloco de cada imagem, a
+# análise do texto, a busca no cache e a montagem da assinatura
+_COMPILED_INDICES = [_compile_index(formula) for formula in _INDEX_FORMULAS.values()]
+
 class TchAtrAnalysisService:
     """
     Serviço para orquestrar a análise e predição de TCH e ATR.
@@ -31,160 +102,179 @@ class TchAtrAnalysisService:
         pass
 
 
-    def _load_and_resize_bands(self, band_paths: Dict[str, Path]) -> Dict[str, np.ndarray]:
+    def _load_and_resize_bands(self, band_paths: Dict[str, Union[str, Path]]) -> Dict[str, np.ndarray]:
         """
         Carrega e redimensiona as bandas para um tamanho comum.
         Esta função substitui e corrige a 'carregar_bandas' do script.
+
+        Cada banda é aberta uma única vez; o shape alvo sai dos cabeçalhos e a
+        leitura já reamostra (bilinear) dentro do GDAL, em paralelo por banda.
         """
-        bands_data = {}
-        target_shape = None
+        datasets = {}
+        try:
+            for band_name, file_path in band_paths.items():
+                try:
+                    datasets[band_name] = rasterio.open(file_path)
+                except rasterio.errors.RasterioIOError:
+                    raise IOError(f"Erro ao ler o arquivo da banda {band_name}: {file_path}")
 
-        for band_name, file_path in band_paths.items():
-            try:
-                with rasterio.open(file_path) as src:
-                    if target_shape is None or (src.height * src.width 
- > target_shape[0] * target_shape[1]):
-                        target_shape = (src.height, src.width)
-            except rasterio.errors.RasterioIOError:
-                raise IOError(f"Erro ao ler o arquivo da banda {band_name}: {file_path}")
-
-        if target_shape is None:
-            raise ValueError("Nenhuma banda pôde ser lida para determinar o shape alvo.")
-
-        for band_name, file_path in band_paths.items():
-            with rasterio.open(file_path) as src:
-                data = src.read(1)
-                if data.shape != target_shape:
-                    data = resize(data, target_shape, preserve_range=True, anti_aliasing=True)
-          
-                bands_data[band_name] = data.flatten()
-        
-        return bands_data
-
-    def _calculate_indices(self, df_bandas: pd.DataFrame) -> pd.DataFrame:
-        """
-        Calcula todos os índices de vegetação.
-        (Lógica idêntica à fornecida, mantida como está)
-        """
-        def NDVI(df): return (df['B08'] - df['B04']) / (df['B08'] + df['B04'] + CFG.eps)
-        def GNDVI(df): return (df['B08'] - df['B03']) / (df['B08'] + df['B03'] + CFG.eps)
-        def VARI(df): return (df['B03'] - df['B04']) / (df['B03'] + df['B04'] - df['B02'] + CFG.eps)
-        def ARVI(df): return (df['B08'] - (2 * df['B04']) + df['B02']) / (df['B08'] + (2 * df['B04']) + df['B02'] + CFG.eps)
-        def NDWI(df): return (df['B03'] - df['B08']) / (df['B08'] + df['B03'] + CFG.eps)
-        def NDMI(df): return (df['B08'] - df['B11']) / (df['B08'] + df['B11'] + CFG.eps)
-        def SAVI(df): return (df['B08'] - df['B11']) / ((df['B08'] + df['B11'] + 0.55) * (1 + 0.55))
-        def MSI(df): return df['B11'] / (df['B8A'] + CFG.eps)
-        def SIPI(df): return (df['B08'] - df['B02']) / (df['B08'] - df['B04'] + CFG.eps)
-        def FIDET(df): return df['B12'] / (df['B8A'] * df['B09'] + CFG.eps)
-        def NDRE(df): return (df['B09'] - df['B05']) / (df['B09'] + df['B05'] + CFG.eps)
-        def brightness(df): return (df[CFG.BANDS_TO_DOWNLOAD].apply(abs, axis=1).sum(axis=1)) / 12
-        def NGRDI(df): return (df['B03'] - df['B04']) / (df['B03'] + df['B04'] + CFG.eps)
-        def RI(df): return (df['B04'] / (df['B03'] + CFG.eps)) - 1
-        def GLI(df): return df['B03'] / (df['B04'] + df['B03'] + df['B02'] + CFG.eps)
-        def VARIgreen(df): return (df['B03'] - df['B04']) / (df['B03'] + df['B04'] - df['B02'] + CFG.eps)
-        def CIVE(df): return (0.441 * df['B04']) - (0.811 * df['B03']) + (0.385 * df['B02']) + 18.78745
-        def VEG(df): return ((df['B04'] - df['B02']) * (df['B04'] - df['B03']))**.5 / (df['B04'] + df['B02'] + df['B03'] + CFG.eps)
-        def VDVI(df): return (df['B03'] - df['B02']) / (df['B03'] + df['B02'] + CFG.eps)
-        def IAF(df): return df['B08'] / (df['B04'] + CFG.eps)
-        def ExG(df): return 2 * df['B03'] - df['B04'] - df['B02']
-        def ExGR(df): return (3 * df['B03'] - 2.4 * df['B04'] - 1.5 * df['B08']) / (df['B03'] + 2.4 * df['B04'] + 1.5 * df['B08'] + CFG.eps)
-        def COM(df): return df['B08'] / (df['B03'] + CFG.eps)
-        
-        df_resultado = df_bandas.copy()
-
-        # Calcula e adiciona cada índice
-        df_resultado['NDVI'] = NDVI(df_bandas)
-        df_resultado['GNDVI'] = GNDVI(df_bandas)
-        df_resultado['VARI'] = VARI(df_bandas)
-        df_resultado['ARVI'] = ARVI(df_bandas)
-        df_resultado['NDWI'] = NDWI(df_bandas)
-        df_resultado['NDMI'] = NDMI(df_bandas)
-        df_resultado['SAVI'] = SAVI(df_bandas)
-        df_resultado['MSI'] = MSI(df_bandas)
-        df_resultado['SIPI'] = SIPI(df_bandas)
-        df_resultado['FIDET'] = FIDET(df_bandas)
-        df_resultado['NDRE'] = NDRE(df_bandas)
-        df_resultado['brightness'] = brightness(df_bandas)
-        df_resultado['NGRDI'] = NGRDI(df_bandas)
-        df_resultado['RI'] = RI(df_bandas)
-        df_resultado['GLI'] = GLI(df_bandas)
-        df_resultado['VARIgreen'] = VARIgreen(df_bandas)
-        df_resultado['CIVE'] = CIVE(df_bandas)
-        df_resultado['VEG'] = VEG(df_bandas)
-        df_resultado['VDVI'] = VDVI(df_bandas)
-        df_resultado['IAF'] = IAF(df_bandas)
-        df_resultado['ExG'] = ExG(df_bandas)
-        df_resultado['ExGR'] = ExGR(df_bandas)
-        df_resultado['COM'] = COM(df_bandas)
-
-        return df_resultado
-
-    def _normalize_dataframe(self, df: pd.DataFrame, feature_stats: dict) -> pd.DataFrame:
-        """
-        Normaliza as colunas do DataFrame para o intervalo [-1, 1]
-        usando o dicionário de estatísticas carregado.
-        """
-        df_normalizado = df.copy()
-        
-        for col in df_normalizado.columns:
-            if col in feature_stats:
-                stats = feature_stats[col]
-                min_val = stats.get('min')
-                max_val = stats.get('max')
-
-                if min_val is not None and max_val is not None:
-                    range_val = max_val - min_val
-                    if range_val > 0:
-                        df_normalizado[col] = 2 * ((df_normalizado[col] - min_val) / range_val) - 1
-                    else:
-                        df_normalizado[col] = 0
-        
-        return df_normalizado
-
-    def _prepare_image_features(self, band_paths: Dict[str, Path]) -> pd.DataFrame:
-        """
-        Prepara um DataFrame com todas as features 
- derivadas das imagens.
+            if not datasets:
+                raise ValueError("Nenhuma banda pôde ser lida para determinar o shape alvo.")
+
+            target_shape = max(
+                ((src.height, src.width) for src in datasets.values()),
+                key=lambda shape: shape[0] * shape[1]
+            )
+
+            futures = {
+                band_name: _band_read_executor.submit(_read_band, src, target_shape)
+                for band_name, src in datasets.items()
+            }
+            return {band_name: future.result() for band_name, future in futures.items()}
+        finally:
+            for src in datasets.values():
+                src.close()
+
+    def _calculate_indices(self, bands_data: Dict[str, np.ndarray]) -> Dict[str, float]:
+        """
+        Calcula o máximo de cada banda e de cada índice de vegetação.
+
+        O modelo só usa o máximo por coluna, então os pixels são processados em
+        blocos de INDEX_TILE_PIXELS: os programas numexpr pré-compilados avaliam
+        as fórmulas do bloco em um buffer pequeno (que cabe no cache) e só o
+        máximo acumulado é mantido, sem nunca materializar os índices na
+        resolução completa.
+        """
+        # As bandas entram como float32 (já lidas assim): o numexpr não opera
+        # sobre uint16 e, em inteiros sem sinal, as subtrações dariam a volta.
+        # float32 sobra para bandas de até 16 bits e reduz o tráfego à metade.
+        bands = {
+            band: np.asarray(data, dtype=np.float32)
+            for band, data in bands_data.items()
+        }
+        n_pixels = len(next(iter(bands.values())))
+
+        # fmax ignora NaN (como o max do pandas) sem emitir avisos
+        features = {band: float(np.fmax.reduce(data)) for band, data in bands.items()}
+
+        running_max = np.full(len(_INDEX_FORMULAS), np.nan, dtype=np.float32)
+        # Ordem 'F': cada coluna do bloco é contígua e pode ser usada como 'out'
+        scratch = np.empty(
+            (min(n_pixels, CFG.INDEX_TILE_PIXELS), len(_INDEX_FORMULAS)), dtype=np.float32, order='F')
+        for start in range(0, n_pixels, CFG.INDEX_TILE_PIXELS):
+            stop = min(start + CFG.INDEX_TILE_PIXELS, n_pixels)
+            tile = scratch[:stop - start]
+            inputs = {band: data[start:stop] for band, data in bands.items()}
+            inputs.update(_INDEX_CONSTANTS)
+            for i, (program, names, ex_uses_vml) in enumerate(_COMPILED_INDICES):
+                program(*(inputs[name] for name in names), out=tile[:, i], ex_uses_vml=ex_uses_vml)
+            np.fmax(running_max, np.fmax.reduce(tile, axis=0), out=running_max)
+
+        features.update(zip(_INDEX_FORMULAS, running_max.tolist()))
+        return features
+
+    def _normalization_params(self, columns: List[str], feature_stats: dict) -> Tuple[np.ndarray, ...]:
+        """
+        Converte 'feature_stats' em vetores alinhados às colunas: mínimo,
+        amplitude, máscara das colunas normalizadas e das de amplitude zero.
+        Colunas sem estatísticas completas ficam fora das duas máscaras.
+        """
+        mins = np.zeros(len(columns))
+        ranges = np.ones(len(columns))
+        normalize = np.zeros(len(columns), dtype=bool)
+        zero_range = np.zeros(len(columns), dtype=bool)
+
+        for j, col in enumerate(columns):
+            stats = feature_stats.get(col)
+            if not stats:
+                continue
+            min_val = stats.get('min')
+            max_val = stats.get('max')
+            if min_val is None or max_val is None:
+                continue
+            range_val = max_val - min_val
+            if range_val > 0:
+                mins[j] = min_val
+                ranges[j] = range_val
+                normalize[j] = True
+            else:
+                zero_range[j] = True
+
+        return mins, ranges, normalize, zero_range
+
+    def _normalize_values(self, values: np.ndarray, params: Tuple[np.ndarray, ...]) -> np.ndarray:
+        """
+        Normaliza as colunas para o intervalo [-1, 1] com os vetores de
+        '_normalization_params', todas de uma vez sobre o array numpy.
+        """
+        mins, ranges, normalize, zero_range = params
+        normalized = np.where(normalize, 2 * ((values - mins) / ranges) - 1, values)
+        normalized[..., zero_range] = 0
+        return normalized
+
+    def _prepare_image_features(self, band_paths: Dict[str, Union[str, Path]]) -> Dict[str, float]:
+        """
+        Prepara todas as features derivadas das imagens (o máximo de cada
+        banda e de cada índice), por nome.
         """
         bands_data = self._load_and_resize_bands(band_paths)
-        df_bands = pd.DataFrame(bands_data)
-        df_indices = self._calculate_indices(df_bands)
-        df_aggregated = df_indices.max().to_frame().T
-        return df_aggregated
+        return self._calculate_indices(bands_data)
 
-    def _predict(self, image_features_df: pd.DataFrame, hectares: float, model_artifacts: dict) -> float:
+    def _model_layout(self, model_artifacts: dict) -> Tuple[Dict[str, int], Tuple[np.ndarray, ...]]:
         """
-        Adiciona features externas, normaliza e executa a predição.
+        Posição de cada feature no vetor do modelo e vetores de normalização.
+        Dependem só do modelo: são montados uma vez e guardados nos próprios
+        artefatos (compartilhados pelo cache de modelos).
+        """
+        layout = model_artifacts.get('_layout')
+        if layout is None:
+            model_feature_list = list(model_artifacts['model_feature_list'])
+            feature_index = {name: i for i, name in enumerate(model_feature_list)}
+            params = self._normalization_params(model_feature_list, model_artifacts['feature_stats'])
+            layout = model_artifacts['_layout'] = (feature_index, params)
+        return layout
+
+    def _feature_matrix(self, samples: List[Tuple[Dict[str, float], float]], model_artifacts: dict) -> np.ndarray:
+        """
+        Monta a matriz (N, F) normalizada, na ordem exata do modelo: uma linha
+        por par (features das imagens, hectares).
+        """
+        feature_index, params = self._model_layout(model_artifacts)
+        hectares_index = feature_index.get('Hectares')
+
+        # Features que o modelo espera e não foram calculadas (ou deram NaN) ficam em 0
+        matrix = np.zeros((len(samples), len(feature_index)))
+        for row, (image_features, hectares) in zip(matrix, samples):
+            for name, value in image_features.items():
+                i = feature_index.get(name)
+                if i is not None:
+                    row[i] = value
+            # Adiciona a feature 'Hectares' que vem dos metadados da ROI
+            if hectares_index is not None:
+                row[hectares_index] = hectares
+        matrix[np.isnan(matrix)] = 0
+
+        return self._normalize_values(matrix, params)
+
+    def _predict_batch(self, samples: List[Tuple[Dict[str, float], float]], model_artifacts: dict) -> np.ndarray:
+        """
+        Predição de várias amostras com uma única chamada a model.predict.
         USA OS ARTEFATOS DO MODELO FORNECIDOS.
         """
-        # Copia para não alterar o DataFrame original
-        feature_vector = image_features_df.copy()
-
-        # Adiciona a feature 'Hectares' que vem dos metadados da ROI
-        feature_vector['Hectares'] = hectares
-        
-        # Pega a lista de features do dicionário de artefatos
-        model_feature_list = model_artifacts['model_feature_list']
-        
-        # Garante que o DataFrame final tenha todas as colunas que o modelo espera.
-        final_vector = pd.DataFrame(columns=model_feature_list)
-        final_vector = pd.concat([final_vector, feature_vector], ignore_index=True).fillna(0)
-        
-        # Seleciona e reordena as colunas para bater com a ordem exata do modelo
-        vector_for_scaling = final_vector[model_feature_list]
-
-        # Normaliza 
-        vector_normalized = self._normalize_dataframe(
-            vector_for_scaling, 
-            feature_stats=model_artifacts['feature_stats']
+        matrix = pd.DataFrame(
+            self._feature_matrix(samples, model_artifacts),
+            columns=model_artifacts['model_feature_list']
         )
-        
-        # Realiza a predição (usando o modelo correto)
-        prediction = model_artifacts['model'].predict(vector_normalized)
-        
-        return float(prediction[0])
+        return np.asarray(model_artifacts['model'].predict(matrix), dtype=float)
+
+    def _predict(self, image_features: Dict[str, float], hectares: float, model_artifacts: dict) -> float:
+        """
+        Adiciona features externas, normaliza e executa a predição.
+        USA OS ARTEFATOS DO MODELO FORNECIDOS.
+        """
+        return float(self._predict_batch([(image_features, hectares)], model_artifacts)[0])
 
-    def run_analysis_pipeline(self, band_paths: Dict[str, Path], hectares: float, model_artifacts: dict) -> Dict:
+    def run_analysis_pipeline(self, band_paths: Dict[str, Union[str, Path]], hectares: float, model_artifacts: dict) -> Dict:
         """
         Ponto de entrada público para executar todo o pipeline de análise.
         AGORA REQUER OS ARTEFATOS DO MODELO.
@@ -213,5 +303,51 @@ class TchAtrAnalysisService:
                 "message": str(e)
             }
 
+    def run_analysis_batch(
+        self,
+        samples: List[Tuple[Dict[str, Union[str, Path]], float]],
+        model_artifacts: dict,
+        executor: Optional[Executor] = None
+    ) -> List[Dict]:
+        """
+        Executa o pipeline para vários conjuntos de bandas (ex.: todas as datas
+        de todas as ROIs de um job), cada um com sua área em hectares.
+
+        As features de cada conjunto são extraídas no 'executor' (se fornecido)
+        e o modelo roda uma única vez sobre a matriz empilhada. Retorna um
+        resultado por conjunto, na mesma ordem e formato de run_analysis_pipeline.
+        """
+        def extract(band_paths):
+            try:
+                return self._prepare_image_features(band_paths), None
+            except Exception as e:
+                logger.error(f"Falha no pipeline de análise para o conjunto de bandas: {e}", exc_info=True)
+                return None, e
+
+        mapper = executor.map if executor is not None else map
+        extracted = list(mapper(extract, [band_paths for band_paths, _ in samples]))
+
+        results = [
+            {"status": "error", "message": str(error)} if features is None else None
+            for features, error in extracted
+        ]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        try:
+            predictions = self._predict_batch(
+                [(extracted[i][0], samples[i][1]) for i in pending], model_artifacts)
+        except Exception as e:
+            logger.error(f"Falha na predição em lote de {len(pending)} conjunto(s) de bandas: {e}", exc_info=True)
+            for i in pending:
+                results[i] = {"status": "error", "message": str(e)}
+            return results
+
+        for i, predicted_value in zip(pending, predictions.tolist()):
+            results[i] = {"status": "success", "predicted_atr": predicted_value}
+        logger.info(f"Análise em lote concluída: {len(pending)} de {len(samples)} conjunto(s) de bandas preditos.")
+        return results
+
 # Instancia o serviço sem carregar modelos
 analysis_service = TchAtrAnalysisService()
\ No newline at end of file
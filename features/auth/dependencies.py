@@ -1,10 +1,39 @@
-from typing import Optional
+import hashlib
+import time
+from typing import Dict, Optional, Tuple
 from fastapi import Depends, HTTPException, status, Cookie
 from jose import JWTError, jwt
 
-from config import settings
 from ..users.queries import get_user_by_email
 from .schemas import TokenData
+from .service import JWT_ALGORITHMS, get_jwt_key
+
+
+# Cache curto de tokens já validados: evita o HMAC do JWT e a consulta do
+# usuário a cada requisição de uma sessão ativa. A chave é um digest do token
+# (não o token em si), e uma entrada nunca vive além da expiração do JWT.
+# Alterações no usuário (ex.: role) aparecem em até _USER_CACHE_TTL segundos.
+_USER_CACHE_TTL = 60.0
+_USER_CACHE_MAX = 10_000
+_user_cache: Dict[bytes, Tuple[float, dict]] = {}
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _cache_user(key: bytes, user: dict, token_exp: Optional[float]) -> None:
+    now = time.time()
+    expires_at = now + _USER_CACHE_TTL
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    if len(_user_cache) >= _USER_CACHE_MAX:
+        # Descarta os vencidos; se ainda estiver cheio, o mais antigo
+        for stale in [k for k, (exp, _) in _user_cache.items() if exp <= now]:
+            del _user_cache[stale]
+        if len(_user_cache) >= _USER_CACHE_MAX:
+            del _user_cache[next(iter(_user_cache))]
+    _user_cache[key] = (expires_at, user)
 
 
 async def get_current_user(access_token: Optional[str] = Cookie(None)):
@@ -18,9 +47,17 @@ async def get_current_user(access_token: Optional[str] = Cookie(None)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Não autenticado"
         )
+
+    key = _token_key(access_token)
+    cached = _user_cache.get(key)
+    if cached is not None:
+        if cached[0] > time.time():
+            return cached[1]
+        _user_cache.pop(key, None)
+
     try:
-        payload = jwt.decode(access_token, settings.SECRET_KEY,
-                             algorithms=[settings.ALGORITHM])
+        payload = jwt.decode(access_token, get_jwt_key(),
+                             algorithms=JWT_ALGORITHMS)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
@@ -31,4 +68,5 @@ async def get_current_user(access_token: Optional[str] = Cookie(None)):
     user = await get_user_by_email(email=token_data.email)
     if user is None:
         raise credentials_exception
+    _cache_user(key, user, payload.get("exp"))
     return user
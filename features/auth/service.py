@@ -1,11 +1,29 @@
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Union
-from jose import jwt
+from jose import jwk, jwt
+from jose.backends.base import Key
 
 from fastapi.security import OAuth2PasswordBearer
 from config import settings
 
 
+JWT_ALGORITHMS = [settings.ALGORITHM]
+
+
+@lru_cache(maxsize=None)
+def get_jwt_key() -> Key:
+    """
+    Chave de assinatura já construída a partir de SECRET_KEY.
+
+    Com uma string, o python-jose monta o objeto de chave (e valida o
+    segredo) a cada encode/decode; passando o objeto pronto esse passo é
+    pulado. É criada na primeira chamada para que a importação não falhe
+    quando SECRET_KEY ainda não estiver configurada.
+    """
+    return jwk.construct(settings.SECRET_KEY, settings.ALGORITHM)
+
+
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -15,7 +33,7 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
             timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(
-        to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+        to_encode, get_jwt_key(), algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
@@ -28,5 +46,5 @@ def create_refresh_token(data: dict):
         timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(
-        to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+        to_encode, get_jwt_key(), algorithm=settings.ALGORITHM)
     return encoded_jwt
@@ -4,53 +4,131 @@ import logging
 import asyncio
 import aiohttp
 import aiofiles
+import rasterio
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-from shapely.geometry import shape, mapping, Polygon, MultiPolygon
+from functools import lru_cache
+from shapely.geometry import shape, mapping
 
 from services.earth_engine_initializer import initialize_earth_engine
+from services.shapefile_service import convert_3d_to_2d
+from utils.json_utils import json_dumps_bytes, json_loads
 from utils.text_normalizer import normalize_name
 
 logger = logging.getLogger(__name__)
 
+# Tamanho dos blocos lidos das respostas de download do GEE (1 MiB); também é
+# o buffer do arquivo, que junta os blocos menores entregues pelo socket
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Downloads simultâneos por ROI (todas as datas e, no fallback, as bandas
+# dividem o mesmo limite); igual ao limite de conexões por host da sessão
+_MAX_CONCURRENT_DOWNLOADS = 16
+
+# Sessão HTTP compartilhada pelos downloads: as conexões TLS com o GEE ficam
+# abertas (keep-alive) entre ROIs, em vez de um handshake por sessão nova.
+# A sessão pertence ao loop em que foi criada e é recriada se o loop mudar.
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """Retorna a sessão compartilhada, criando-a na primeira chamada."""
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=64, limit_per_host=_MAX_CONCURRENT_DOWNLOADS, keepalive_timeout=60, ttl_dns_cache=300)
+        _http_session = aiohttp.ClientSession(connector=connector)
+        _http_session_loop = loop
+    return _http_session
+
+
+async def close_http_session() -> None:
+    """Fecha a sessão compartilhada (chamado no encerramento da aplicação)."""
+    global _http_session, _http_session_loop
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+    _http_session_loop = None
+
+
+def _split_multiband(stack_path: Path, band_files: List[Path]) -> List[str]:
+    """Grava cada banda do GeoTIFF multibanda em seu próprio arquivo, na ordem dada."""
+    with rasterio.open(stack_path) as src:
+        profile = src.profile.copy()
+        profile.update(count=1)
+        for index, filename in enumerate(band_files, start=1):
+            with rasterio.open(filename, 'w', **profile) as dst:
+                dst.write(src.read(index), 1)
+    return [str(filename) for filename in band_files]
+
+
+def _num_coordinates(geom) -> int:
+    """Total de vértices da geometria (todos os anéis de todas as partes)."""
+    if hasattr(geom, 'geoms'):
+        return sum(_num_coordinates(part) for part in geom.geoms)
+    if hasattr(geom, 'exterior'):
+        return len(geom.exterior.coords) + sum(len(ring.coords) for ring in geom.interiors)
+    return len(geom.coords)
+
+
+def _simplify_to_vertex_limit(geom, max_vertices: int, tolerance: float = 0.0001, max_attempts: int = 16):
+    """
+    Douglas-Peucker com o número de vértices como critério de parada: parte da
+    tolerância original e a dobra até a geometria ter no máximo 'max_vertices'
+    (uma tolerância fixa podia deixar milhares de vértices em ROIs grandes).
+    Vale também para MultiPolygons, contando os vértices de todas as partes.
+    """
+    if _num_coordinates(geom) <= max_vertices:
+        return geom
+    simplified = geom
+    for _ in range(max_attempts):
+        simplified = geom.simplify(tolerance, preserve_topology=True)
+        if _num_coordinates(simplified) <= max_vertices:
+            break
+        tolerance *= 2
+    return simplified
+
+
+@lru_cache(maxsize=512)
+def _ee_geometry_from_json(geometry_json: bytes, max_vertices: int) -> ee.Geometry:
+    """
+    Converte o GeoJSON (serializado, para servir de chave) em ee.Geometry:
+    correção da validade, remoção do Z e simplificação acima de 'max_vertices'.
+    A mesma ROI é baixada em vários jobs; o resultado é determinístico e o
+    ee.Geometry é só a descrição local do objeto, então pode ser reaproveitado.
+    """
+    geom = shape(json_loads(geometry_json))
+    if not geom.is_valid:
+        geom = geom.buffer(0)
+    geom = convert_3d_to_2d(geom)
+    geom = _simplify_to_vertex_limit(geom, max_vertices)
+    return ee.Geometry(mapping(geom))
+
 
 class EarthEngineService:
 
     def _convert_3d_to_2d(self, geom):
-        if geom is None or not geom.has_z:
-            return geom
-        if isinstance(geom, Polygon):
-            exterior_2d = [(x, y) for x, y, *_ in geom.exterior.coords]
-            interiors_2d = [[(x, y) for x, y, *_ in interior.coords] for interior in geom.interiors]
-            return Polygon(exterior_2d, interiors_2d)
-        elif isinstance(geom, MultiPolygon):
-            polygons_2d = [self._convert_3d_to_2d(poly) for poly in geom.geoms]
-            return MultiPolygon(polygons_2d)
-        return geom
+        return convert_3d_to_2d(geom)
 
     def _geometry_to_ee(self, geometry_dict: Dict, max_vertices: int = 4000) -> ee.Geometry:
         try:
-            geom = shape(geometry_dict)
-            if not geom.is_valid:
-                geom = geom.buffer(0)
-            geom = self._convert_3d_to_2d(geom)
-            if hasattr(geom, 'exterior') and len(geom.exterior.coords) > max_vertices:
-                geom = geom.simplify(0.0001, preserve_topology=True)
-            geojson_dict = mapping(geom)
-            return ee.Geometry(geojson_dict)
+            return _ee_geometry_from_json(json_dumps_bytes(geometry_dict), max_vertices)
         except Exception as e:
             logger.error(f"Erro ao converter geometria para EE: {e}")
             raise ValueError("Falha ao converter a geometria para o formato do Earth Engine.")
 
-    async def _download_band_async(self, session: aiohttp.ClientSession, image: ee.Image, band: str, ee_geom_to_clip: ee.Geometry, filename: Path, scale: int = 10, crs: str = 'EPSG:4326') -> Optional[str]:
+    async def _download_band_async(self, session: aiohttp.ClientSession, image: ee.Image, band: str, ee_geom_to_clip: ee.Geometry, region_to_download: List, filename: Path, scale: int = 10, crs: str = 'EPSG:4326') -> Optional[str]:
         """
         Baixa uma única banda de forma assíncrona usando a URL de download do GEE.
+        'region_to_download' são as coordenadas do bounds da geometria, obtidas
+        uma vez por ROI pelo chamador.
         """
         try:
             single_band_image = image.select(band)
             clipped_image = single_band_image.clip(ee_geom_to_clip)
-            region_to_download = ee_geom_to_clip.bounds().getInfo()['coordinates']
 
             logger.info(f"Preparando download para banda {band} em {filename.name}")
             
@@ -67,11 +145,8 @@ class EarthEngineService:
 
             async with session.get(download_url) as response:
                 if response.status == 200:
-                    async with aiofiles.open(filename, 'wb') as f:
-                        while True:
-                            chunk = await response.content.read(1024)
-                            if not chunk:
-                                break
+                    async with aiofiles.open(filename, 'wb', buffering=_DOWNLOAD_CHUNK_SIZE) as f:
+                        async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
                             await f.write(chunk)
                     logger.info(f"Banda {band} baixada com sucesso: {filename.name}")
                     return str(filename)
@@ -83,6 +158,48 @@ class EarthEngineService:
             logger.error(f"Erro excepcional ao baixar a banda {band}: {e}", exc_info=True)
             return None
 
+    async def _download_stack_async(self, session: aiohttp.ClientSession, image: ee.Image, band_files: Dict[str, Path], ee_geom_to_clip: ee.Geometry, region_to_download: List, scale: int = 10, crs: str = 'EPSG:4326') -> Optional[List[str]]:
+        """
+        Baixa todas as bandas de uma imagem em um único GeoTIFF multibanda e o
+        separa localmente em um arquivo por banda. Retorna None se o download
+        em bloco falhar (ex.: limite de tamanho do GEE), para o chamador recorrer
+        ao download banda a banda.
+        """
+        bands = list(band_files)
+        stack_path = next(iter(band_files.values())).with_suffix('.stack.tif')
+        try:
+            clipped_image = image.select(bands).clip(ee_geom_to_clip)
+
+            loop = asyncio.get_running_loop()
+            download_url = await loop.run_in_executor(
+                None,
+                lambda: clipped_image.getDownloadURL({
+                    'scale': scale,
+                    'region': region_to_download,
+                    'format': 'GEO_TIFF',
+                    'crs': crs
+                })
+            )
+
+            async with session.get(download_url) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning(f"Falha no download multibanda ({len(bands)} bandas). Status: {response.status}. Resposta: {error_text}")
+                    return None
+                async with aiofiles.open(stack_path, 'wb', buffering=_DOWNLOAD_CHUNK_SIZE) as f:
+                    async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+                        await f.write(chunk)
+
+            # A separação lê e grava rasters: roda em thread
+            return await loop.run_in_executor(
+                None, _split_multiband, stack_path, [band_files[band] for band in bands])
+        except Exception as e:
+            logger.warning(f"Erro no download multibanda, recorrendo ao download por banda: {e}", exc_info=True)
+            return None
+        finally:
+            if stack_path.exists():
+                stack_path.unlink()
+
     async def download_images_for_roi(
         self,
         *,
@@ -113,14 +230,28 @@ class EarthEngineService:
 
             ee_geom = self._geometry_to_ee(roi['geometria'])
 
-            collection = (
-                ee.ImageCollection('COPERNICUS/S2_HARMONIZED')
-                .filterBounds(ee_geom)
-                .filterDate(start_date, end_date)
-                .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud_percentage))
+            # Um único filtro composto (espacial -> data -> nuvens) em vez de três
+            # nós .filter encadeados, deixando o planejador do GEE combiná-los
+            collection = ee.ImageCollection('COPERNICUS/S2_HARMONIZED').filter(
+                ee.Filter.And(
+                    ee.Filter.bounds(ee_geom),
+                    ee.Filter.date(start_date, end_date),
+                    ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud_percentage),
+                )
             )
 
-            num_images = collection.size().getInfo()
+            # Uma única chamada ao servidor traz as datas de todas as imagens (e,
+            # com elas, a contagem) junto com o bounds da geometria, em vez de
+            # um getInfo() por imagem e outro por banda.
+            # getInfo() é bloqueante, então roda fora do event loop.
+            metadata_ee = ee.Dictionary({
+                'dates': collection.aggregate_array('system:time_start'),
+                'bounds': ee_geom.bounds().coordinates(),
+            })
+            loop = asyncio.get_running_loop()
+            metadata = await loop.run_in_executor(None, metadata_ee.getInfo)
+            timestamps, region_to_download = metadata['dates'], metadata['bounds']
+            num_images = len(timestamps)
 
             if num_images == 0:
                 logger.info(f"Nenhuma imagem encontrada para a ROI {roi_id} com os filtros aplicados.")
@@ -131,40 +262,59 @@ class EarthEngineService:
             image_list = collection.toList(num_images)
 
             total_files_downloaded = 0
-            semaphore = asyncio.Semaphore(5)
+            semaphore = asyncio.Semaphore(_MAX_CONCURRENT_DOWNLOADS)
 
-            async def download_with_semaphore(session, image, band_name, ee_geom_to_clip, filename, scale):
+            async def download_image(session, image, band_files, date_str):
+                # Um único GeoTIFF multibanda por data; banda a banda só se ele falhar
                 async with semaphore:
-                    return await self._download_band_async(session, image, band_name, ee_geom_to_clip, filename, scale)
-
-            async with aiohttp.ClientSession() as session:
-                for i in range(num_images):
-                    image = ee.Image(image_list.get(i))
-                    date_millis = image.get('system:time_start').getInfo()
-                    date_str = datetime.fromtimestamp(date_millis/1000).strftime('%Y-%m-%d')
-                    date_dir = talhao_dir / date_str
-                    os.makedirs(date_dir, exist_ok=True)
-                    ee_geom_for_download = ee_geom
-
-                    tasks = []
-                    for band_gee_name in bands_for_gee:
-                        band_name_for_file = band_gee_name
-                        if band_gee_name.upper().startswith('B') and not band_gee_name.upper().endswith('A'):
-                            try:
-                                numeric_part = int(band_gee_name[1:])
-                                band_name_for_file = f'B{numeric_part:02d}'
-                            except ValueError:
-                                pass
-
-                        filename = date_dir / f"sentinel2_{roi_id}_{date_str}_{band_name_for_file}.tif"
-                        if not os.path.exists(filename):
-                            tasks.append(download_with_semaphore(session, image, band_gee_name, ee_geom_for_download, filename, scale))
-
-                    if tasks:
-                        logger.info(f"Iniciando download de {len(tasks)} bandas para a data {date_str} (concorrência limitada)...")
-                        download_results = await asyncio.gather(*tasks)
-                        successful_downloads = [res for res in download_results if res]
-                        total_files_downloaded += len(successful_downloads)
+                    logger.info(f"Iniciando download de {len(band_files)} bandas para a data {date_str}...")
+                    downloaded = await self._download_stack_async(
+                        session, image, band_files, ee_geom, region_to_download, scale)
+                if downloaded is not None:
+                    return len(downloaded)
+
+                async def download_band(band_gee_name, filename):
+                    async with semaphore:
+                        return await self._download_band_async(
+                            session, image, band_gee_name, ee_geom, region_to_download, filename, scale)
+
+                download_results = await asyncio.gather(
+                    *(download_band(band, filename) for band, filename in band_files.items()))
+                return sum(1 for res in download_results if res)
+
+            session = _get_http_session()
+            tasks = []
+            for i, date_millis in enumerate(timestamps):
+                image = ee.Image(image_list.get(i))
+                date_str = datetime.fromtimestamp(date_millis/1000).strftime('%Y-%m-%d')
+                date_dir = talhao_dir / date_str
+                # talhao_dir já existe; se a pasta da data acabou de ser criada,
+                # nenhuma banda foi baixada e os os.path.exists abaixo são dispensados
+                try:
+                    date_dir.mkdir()
+                    new_date_dir = True
+                except FileExistsError:
+                    new_date_dir = False
+
+                band_files = {}
+                for band_gee_name in bands_for_gee:
+                    band_name_for_file = band_gee_name
+                    if band_gee_name.upper().startswith('B') and not band_gee_name.upper().endswith('A'):
+                        try:
+                            numeric_part = int(band_gee_name[1:])
+                            band_name_for_file = f'B{numeric_part:02d}'
+                        except ValueError:
+                            pass
+
+                    filename = date_dir / f"sentinel2_{roi_id}_{date_str}_{band_name_for_file}.tif"
+                    if new_date_dir or not os.path.exists(filename):
+                        band_files[band_gee_name] = filename
+
+                if band_files:
+                    tasks.append(download_image(session, image, band_files, date_str))
+
+            if tasks:
+                total_files_downloaded = sum(await asyncio.gather(*tasks))
 
             results.update({
                 "status": "success",
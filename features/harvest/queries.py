@@ -33,40 +33,70 @@ async def create_programacao(
     )
     return dict(new_record)
 
-async def list_programacao_by_user(
+async def list_programacao_agrupada_by_user(
     conn: asyncpg.Connection, 
     user_id: int, 
     start_date: date, 
     end_date: date
 ) -> List[Dict]:
     """
-    Lista todos os agendamentos de um usuário dentro de um intervalo de datas.
+    Lista os agendamentos de um usuário dentro de um intervalo de datas, já
+    agrupados por propriedade e então por data (o formato da resposta da API).
     Junta com a tabela 'regiao_de_interesse' para obter os nomes.
+
+    O agrupamento e a ordenação são feitos no Postgres com jsonb_agg: volta um
+    único valor jsonb (decodificado pelo codec da conexão), sem repetir o nome
+    da propriedade em cada linha. Propriedades seguem a ordem de bytes
+    (COLLATE "C"), a mesma do sort de strings do Python.
     """
     query = """
-        SELECT 
-            p.id,
-            p.user_id,
-            p.talhao_id,
-            p.data_prevista_colheita,
-            p.modelo_id_sugerido,
-            p.status,
-            p.data_criacao,
-            r.nome AS talhao_nome,
-            r.nome_propriedade
-        FROM 
-            programacao_colheita p
-        JOIN 
-            regiao_de_interesse r ON p.talhao_id = r.roi_id
-        WHERE 
-            p.user_id = $1 
-            AND r.user_id = $1 -- Garante que o talhão também é do usuário
-            AND p.data_prevista_colheita BETWEEN $2 AND $3
-        ORDER BY 
-            p.data_prevista_colheita ASC;
+        WITH por_data AS (
+            SELECT 
+                COALESCE(NULLIF(r.nome_propriedade, ''), 'Propriedade Desconhecida') AS propriedade_nome,
+                p.data_prevista_colheita,
+                jsonb_agg(
+                    jsonb_build_object(
+                        'id', p.id,
+                        'talhao_id', p.talhao_id,
+                        'talhao_nome', r.nome,
+                        'status', p.status,
+                        'modelo_id_sugerido', p.modelo_id_sugerido
+                    ) ORDER BY p.id
+                ) AS talhoes_agendados
+            FROM 
+                programacao_colheita p
+            JOIN 
+                regiao_de_interesse r ON p.talhao_id = r.roi_id
+            WHERE 
+                p.user_id = $1 
+                AND r.user_id = $1 -- Garante que o talhão também é do usuário
+                AND p.data_prevista_colheita BETWEEN $2 AND $3
+            GROUP BY 1, 2
+        ),
+        por_propriedade AS (
+            SELECT 
+                propriedade_nome,
+                jsonb_agg(
+                    jsonb_build_object(
+                        'data_prevista_colheita', data_prevista_colheita,
+                        'talhoes_agendados', talhoes_agendados
+                    ) ORDER BY data_prevista_colheita
+                ) AS agendamentos_por_data
+            FROM por_data
+            GROUP BY propriedade_nome
+        )
+        SELECT COALESCE(
+            jsonb_agg(
+                jsonb_build_object(
+                    'propriedade_nome', propriedade_nome,
+                    'agendamentos_por_data', agendamentos_por_data
+                ) ORDER BY propriedade_nome COLLATE "C"
+            ),
+            '[]'::jsonb
+        )
+        FROM por_propriedade;
     """
-    results = await conn.fetch(query, user_id, start_date, end_date)
-    return [dict(row) for row in results]
+    return await conn.fetchval(query, user_id, start_date, end_date)
 
 async def delete_programacao(
     conn: asyncpg.Connection, 
@@ -1,7 +1,6 @@
 import logging
 from typing import List
 from datetime import date
-from collections import defaultdict
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 import asyncpg
@@ -68,48 +67,9 @@ async def list_harvest_schedules(
     try:
         user_id = current_user['id']
         
-        # 1. Busca a lista "plana" de agendamentos (a query já faz o JOIN)
-        flat_schedules = await queries.list_programacao_by_user(conn, user_id, start_date, end_date)
-        
-        # 2. Lógica de Agrupamento em Python
-        # Estrutura: { "Nome da Propriedade": { "data": [lista_de_talhoes], ... }, ... }
-        propriedades_map = defaultdict(lambda: defaultdict(list))
-        
-        for item in flat_schedules:
-            prop_nome = item['nome_propriedade'] or "Propriedade Desconhecida"
-            data_colheita = item['data_prevista_colheita']
-            
-            # Monta o objeto 'Talhao' para a resposta
-            talhao_obj = {
-                "id": item['id'],
-                "talhao_id": item['talhao_id'],
-                "talhao_nome": item['talhao_nome'],
-                "status": item['status'],
-                "modelo_id_sugerido": item['modelo_id_sugerido']
-            }
-            propriedades_map[prop_nome][data_colheita].append(talhao_obj)
-            
-        # 3. Converte os dicionários aninhados na lista de resposta (schema)
-        final_response = []
-        for prop_nome, datas_map in propriedades_map.items():
-            agendamentos_por_data = []
-            
-            for data, talhoes_list in datas_map.items():
-                agendamentos_por_data.append({
-                    "data_prevista_colheita": data,
-                    "talhoes_agendados": talhoes_list
-                })
-            
-            # Ordena os agendamentos pela data
-            agendamentos_por_data.sort(key=lambda x: x['data_prevista_colheita'])
-            
-            final_response.append({
-                "propriedade_nome": prop_nome,
-                "agendamentos_por_data": agendamentos_por_data
-            })
-            
-        # Ordena a resposta final pelo nome da propriedade
-        final_response.sort(key=lambda x: x['propriedade_nome'])
+        # O Postgres já devolve a lista agrupada por propriedade e por data,
+        # ordenada; o response_model valida e converte as datas
+        final_response = await queries.list_programacao_agrupada_by_user(conn, user_id, start_date, end_date)
         
         return final_response
         
@@ -1,5 +1,7 @@
+import asyncio
 import logging
-from typing import List, Optional, Dict
+from collections import OrderedDict
+from typing import List, Optional, Dict, Tuple
 from datetime import date
 import asyncpg
 import joblib
@@ -8,6 +10,12 @@ from . import schemas # Importa o schema de paths
 
 logger = logging.getLogger(__name__)
 
+# Cache LRU dos artefatos carregados, por (modelo_id, caminhos). Os caminhos
+# fazem parte da chave para que um modelo re-treinado no mesmo ID seja relido.
+_MODEL_CACHE_MAX = 4
+_model_cache: "OrderedDict[Tuple, Dict]" = OrderedDict()
+_model_cache_lock: Optional[asyncio.Lock] = None
+
 async def get_active_modelos(conn: asyncpg.Connection) -> List[Dict]:
     """Lista todos os modelos de ATR que estão marcados como 'ativos'."""
     query = """
@@ -65,14 +73,13 @@ async def get_model_paths(conn: asyncpg.Connection, modelo_id: int) -> Optional[
         return None
     return schemas.ModeloATRPaths(**dict(result))
 
-async def load_model_artifacts_from_paths(paths: schemas.ModeloATRPaths) -> Dict:
-    """
-    Carrega os arquivos .joblib do disco a partir dos caminhos fornecidos.
-    Esta função é síncrona (I/O de disco), mas será chamada em um contexto async.
-    """
+def _load_model_artifacts_sync(paths: schemas.ModeloATRPaths) -> Dict:
+    """Carrega os arquivos .joblib do disco (bloqueante; roda em thread)."""
     try:
-        # Usamos os nomes de atributos do schema
-        model = joblib.load(paths.caminho_modelo_joblib)
+        # Usamos os nomes de atributos do schema. Com mmap_mode='r', os arrays
+        # numpy de arquivos não comprimidos são mapeados do page cache em vez de
+        # copiados, e ficam compartilhados entre os processos de worker
+        model = joblib.load(paths.caminho_modelo_joblib, mmap_mode='r')
         stats = joblib.load(paths.caminho_estatisticas_joblib)
         features = joblib.load(paths.caminho_features_joblib)
         
@@ -88,4 +95,45 @@ async def load_model_artifacts_from_paths(paths: schemas.ModeloATRPaths) -> Dict
         raise ValueError(f"Arquivo de modelo não encontrado: {e.filename}")
     except Exception as e:
         logger.error(f"Erro desconhecido ao carregar modelo: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+
+async def load_model_artifacts_from_paths(paths: schemas.ModeloATRPaths) -> Dict:
+    """
+    Carrega os arquivos .joblib do disco a partir dos caminhos fornecidos.
+    A leitura e o unpickle rodam em uma thread para não travar o event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _load_model_artifacts_sync, paths)
+
+
+async def get_model_artifacts(conn: asyncpg.Connection, modelo_id: int) -> Optional[Dict]:
+    """
+    Retorna os artefatos de um modelo ativo, reaproveitando os já carregados.
+    Os caminhos são sempre consultados no DB (consulta barata), então um modelo
+    desativado retorna None mesmo se estiver em cache.
+    """
+    global _model_cache_lock
+
+    paths = await get_model_paths(conn, modelo_id)
+    if not paths:
+        return None
+
+    key = (modelo_id, paths.caminho_modelo_joblib,
+           paths.caminho_estatisticas_joblib, paths.caminho_features_joblib)
+
+    if _model_cache_lock is None:
+        _model_cache_lock = asyncio.Lock()
+
+    # O lock evita que jobs simultâneos do mesmo modelo o carreguem em dobro
+    async with _model_cache_lock:
+        artifacts = _model_cache.get(key)
+        if artifacts is not None:
+            _model_cache.move_to_end(key)
+            return artifacts
+
+        artifacts = await load_model_artifacts_from_paths(paths)
+        _model_cache[key] = artifacts
+        while len(_model_cache) > _MODEL_CACHE_MAX:
+            _model_cache.popitem(last=False)
+        return artifacts
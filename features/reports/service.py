@@ -7,12 +7,13 @@ from uuid import UUID
 import numpy as np
 import os
 import shutil
+import zipfile
 
 from features.analysis import queries as analysis_queries 
 from features.roi.queries import obter_roi_por_id 
 from features.jobs.queries import update_job_status
 from services.report_generator import report_generator
-from utils.upload_utils import cleanup_temp_files 
+from utils.upload_utils import cleanup_temp_files_async
 from features.reports.schemas import ReportRequest
 
 logger = logging.getLogger(__name__)
@@ -36,26 +37,55 @@ def _create_dummy_band_file(file_path: Path, height: int = 100, width: int = 100
         new_dataset.write(np.ones((height, width), dtype=rasterio.uint16) * 5000, 1)
         new_dataset.close()
     
-def _find_analysis_temp_dir(analysis_job_id: int) -> Path:
-    """Heuristicamente encontra o diretório temporário do Job de Análise."""
-    
-    # O Job de Análise descompactou os TIFFs em: /tmp/[hash]/analysis_[ID_ANÁLISE]
-    # O diretório que queremos limpar é o pai: /tmp/[hash]
-    
-    # Busca por qualquer diretório com o sufixo "analysis_[ID_ANÁLISE]"
-    temp_search = list(Path("/tmp").glob(f"*/analysis_{analysis_job_id}"))
-    
-    if not temp_search:
-        # Se falhar a heurística de hash, tenta procurar pelo ID exato
-        temp_search = list(Path("/tmp").glob(f"analysis_{analysis_job_id}"))
-    
-    if temp_search:
-        # O diretório que queremos limpar é o pai (onde o save_uploaded_files criou)
-        # Ex: /tmp/shapefile_upload_[hash]
-        return temp_search[0].parent
-    else:
-        # Se não for encontrado, levanta um erro, pois não podemos gerar o NDVI
-        raise FileNotFoundError(f"Diretório de TIFFs para o Job {analysis_job_id} não encontrado no sistema.")
+def _find_analysis_temp_dir(job_data: Dict) -> Path:
+    """
+    Diretório temporário do Job de Análise: o pai do ZIP enviado, cujo caminho
+    fica gravado no job ('input_path'). É o diretório que o relatório limpa.
+    """
+    input_path = job_data.get('input_path')
+    if input_path:
+        temp_dir = Path(input_path).parent
+        if temp_dir.is_dir():
+            return temp_dir
+    # Sem o diretório não é possível gerar o NDVI
+    raise FileNotFoundError(f"Diretório de TIFFs para o Job {job_data.get('job_id')} não encontrado no sistema.")
+
+
+def _find_band_paths(analysis_temp_dir: Path, bands: List[str]) -> Dict[str, List]:
+    """
+    Busca os TIFFs das bandas no diretório do job: primeiro extraídos em
+    disco e, na falta deles, dentro dos ZIPs enviados, como caminhos
+    '/vsizip/' que o rasterio lê sem extrair.
+
+    O diretório é percorrido uma única vez com os.walk, comparando só strings,
+    em vez de um rglob (com um Path por entrada) para cada banda.
+    """
+    suffixes = {f"_{band}.tif": band for band in bands}
+    found = {band: [] for band in bands}
+    zip_paths = []
+
+    for root, _, files in os.walk(analysis_temp_dir):
+        for name in files:
+            if name.endswith('.zip'):
+                zip_paths.append(os.path.join(root, name))
+                continue
+            if not name.endswith('.tif'):
+                continue
+            band = suffixes.get(name[name.rfind('_'):])
+            if band:
+                found[band].append(Path(root, name))
+
+    for band in bands:
+        if found[band]:
+            continue
+        for zip_path in zip_paths:
+            with zipfile.ZipFile(zip_path) as zip_ref:
+                suffix = f"_{band}.tif"
+                found[band].extend(
+                    f"/vsizip/{os.path.abspath(zip_path)}/{name}"
+                    for name in zip_ref.namelist() if name.endswith(suffix)
+                )
+    return found
 
 
 class ReportService:
@@ -118,12 +148,13 @@ class ReportService:
                 raise ValueError(f"Metadados da ROI {roi_id} não encontrados.")
 
 
-            # 2. LOCALIZAR O DIRETÓRIO TEMPORÁRIO E BUSCAR CAMINHOS (Heurística)
-            analysis_temp_dir = _find_analysis_temp_dir(analysis_job_id)
+            # 2. LOCALIZAR O DIRETÓRIO TEMPORÁRIO (gravado no job) E BUSCAR CAMINHOS
+            analysis_temp_dir = _find_analysis_temp_dir(job_data)
             
-            # Buscar qualquer TIFF de B04 e B08 dentro do diretório de análise (que contém analysis_[ID])
-            b04_paths = list(analysis_temp_dir.rglob('*_B04.tif'))
-            b08_paths = list(analysis_temp_dir.rglob('*_B08.tif'))
+            # Buscar qualquer TIFF de B04 e B08 no diretório do ZIP da análise
+            band_paths = _find_band_paths(analysis_temp_dir, ['B04', 'B08'])
+            b04_paths = band_paths['B04']
+            b08_paths = band_paths['B08']
             
             # --- PLACERHOLDER: Cria arquivos dummy se não existirem para passar no rasterio.open ---
             if not b04_paths or not b08_paths:
@@ -188,7 +219,7 @@ class ReportService:
         finally:
             # LIMPEZA DO DIRETÓRIO DO JOB DE ANÁLISE (ÚLTIMO PASSO DE FATO)
             if analysis_temp_dir and analysis_temp_dir.exists():
-                cleanup_temp_files(analysis_temp_dir)
+                await cleanup_temp_files_async(analysis_temp_dir)
                 logger.info(f"[Report Job {report_job_id}] Diretório do Job de Análise {analysis_job_id} LIMPO.")
             pass
 
@@ -1,21 +1,142 @@
 import logging
-import json
-from typing import List, Dict, Optional, Any
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional, Any, AsyncIterator, Tuple
 import asyncpg
+from shapely.geometry import mapping, shape
 
-from database.session import with_db_connection, get_db_connection
+from database.session import with_db_connection, get_db_connection, register_statement, get_statement
+from utils.json_utils import json_loads, JSONDecodeError
 
 logger = logging.getLogger(__name__)
 
+# --- Statements preparados uma vez por conexão do pool ---
+SQL_INSERT_ROI = register_statement("insert_roi", """
+    INSERT INTO regiao_de_interesse 
+    (user_id, nome, descricao, geometria, tipo_origem, metadata, sistema_referencia,
+     nome_arquivo_original, arquivos_relacionados)
+    VALUES ($1, $2, $3, $4, $5, $6, 'EPSG:4326', $7, $8)
+    RETURNING roi_id, nome, geometria,
+              tipo_origem, status, data_criacao, nome_arquivo_original, metadata
+""")
+
+SQL_INSERT_PROPRIEDADE = register_statement("insert_propriedade", """
+    INSERT INTO regiao_de_interesse (user_id, nome, descricao, geometria, tipo_origem, metadata, sistema_referencia, nome_arquivo_original, tipo_roi, nome_propriedade)
+    VALUES ($1, $2, $3, $4, $5, $6, 'EPSG:4326', $7, 'PROPRIEDADE', $8)
+    RETURNING roi_id, nome, data_criacao, nome_propriedade;
+""")
+
+# Insere todos os talhões de uma propriedade desempacotando arrays paralelos
+# (WITH ORDINALITY preserva a ordem do shapefile), monta a FeatureCollection
+# da propriedade ($5) no próprio PostGIS e a grava nos metadados do pai,
+# tudo em uma única ida ao banco.
+SQL_INSERT_TALHOES = register_statement("insert_talhoes", """
+    WITH inseridos AS (
+        INSERT INTO regiao_de_interesse (user_id, nome, descricao, geometria, tipo_origem, metadata, sistema_referencia, nome_arquivo_original, tipo_roi, nome_propriedade, nome_talhao, roi_pai_id)
+        SELECT $1, t.nome, t.descricao, t.geometria, $2, t.metadata, 'EPSG:4326', $3, 'TALHAO', $4, t.nome_talhao, $5
+        FROM unnest($6::text[], $7::text[], $8::geometry[], $9::jsonb[], $10::text[])
+             WITH ORDINALITY AS t(nome, descricao, geometria, metadata, nome_talhao, ordem)
+        ORDER BY t.ordem
+        RETURNING roi_id, nome_talhao, geometria, metadata
+    ),
+    fc AS (
+        SELECT jsonb_build_object(
+            'type', 'FeatureCollection',
+            'features', COALESCE(jsonb_agg(jsonb_build_object(
+                'type', 'Feature',
+                'geometry', ST_AsGeoJSON(geometria)::jsonb,
+                'properties', jsonb_build_object('roi_id', roi_id, 'nome_talhao', nome_talhao)
+                              || COALESCE(metadata, '{}'::jsonb)
+            ) ORDER BY roi_id), '[]'::jsonb)
+        ) AS payload
+        FROM inseridos
+    ),
+    atualizado AS (
+        UPDATE regiao_de_interesse r
+        SET metadata = r.metadata || jsonb_build_object('feature_collection_talhoes', fc.payload)
+        FROM fc
+        WHERE r.roi_id = $5
+    )
+    SELECT roi_id, nome_talhao, ST_AsGeoJSON(geometria) as geometria_geojson, metadata
+    FROM inseridos
+    ORDER BY roi_id;
+""")
+
+SQL_SELECT_ROI_BY_ID = register_statement("select_roi_by_id", """
+    SELECT roi_id, nome, descricao, geometria,
+           tipo_origem, status, data_criacao, data_modificacao, metadata, tipo_roi, nome_propriedade
+    FROM regiao_de_interesse
+    WHERE roi_id = $1 AND user_id = $2
+""")
+
+# Colunas que 'atualizar_roi' pode alterar; os nomes entram no texto SQL,
+# então só os desta lista são aceitos
+_COLUNAS_ATUALIZAVEIS_ROI = ('nome', 'descricao', 'status')
+
+
+def _sql_update_roi(colunas: Tuple[str, ...]) -> str:
+    sets = [f"{coluna} = ${i}" for i, coluna in enumerate(colunas, start=3)]
+    sets.append("data_modificacao = CURRENT_TIMESTAMP")
+    return f"""
+    UPDATE regiao_de_interesse
+    SET {', '.join(sets)}
+    WHERE roi_id = $1 AND user_id = $2
+    RETURNING roi_id, nome, descricao, geometria,
+              tipo_origem, status, data_criacao, data_modificacao, metadata, tipo_roi, nome_propriedade
+"""
+
+
+def _geometria_de_feature_collection(geojson_data: Dict) -> Dict:
+    features = geojson_data.get('features', [])
+    if not features:
+        raise ValueError("FeatureCollection não contém features")
+
+    if len(features) == 1:
+        geometry = features[0].get('geometry')
+        if not geometry:
+            raise ValueError("Feature não contém geometria")
+        return geometry
+
+    geometries = [feature['geometry'] for feature in features if feature.get('geometry')]
+    if not geometries:
+        raise ValueError(
+            "Nenhuma geometria válida encontrada nas features")
+
+    return {
+        "type": "GeometryCollection",
+        "geometries": geometries
+    }
+
+
+def _geometria_de_feature(geojson_data: Dict) -> Dict:
+    geometry = geojson_data.get('geometry')
+    if not geometry:
+        raise ValueError("Feature não contém geometria")
+    return geometry
+
+
+_GEOJSON_HANDLERS = {
+    'FeatureCollection': _geometria_de_feature_collection,
+    'Feature': _geometria_de_feature,
+}
 
-def extract_geometry_from_geojson(geojson_data):
+_GEOMETRY_TYPES = frozenset({
+    'Point', 'LineString', 'Polygon', 'MultiPoint',
+    'MultiLineString', 'MultiPolygon', 'GeometryCollection'
+})
+
+
+def extract_geometry_from_geojson(geojson_data) -> Tuple[Dict, Optional[Dict]]:
     """
-    Extrai a geometria adequada do GeoJSON para armazenamento no PostGIS
+    Extrai a geometria adequada do GeoJSON para armazenamento no PostGIS.
+    Aceita dict ou string JSON (analisada uma única vez) e retorna
+    (geometria, feature_collection_original); o segundo item só é preenchido
+    quando a entrada é uma FeatureCollection, a única que carrega informação
+    além da geometria extraída.
     """
     if isinstance(geojson_data, str):
         try:
-            geojson_data = json.loads(geojson_data)
-        except json.JSONDecodeError:
+            geojson_data = json_loads(geojson_data)
+        except JSONDecodeError:
             raise ValueError("GeoJSON string inválido")
 
     if not isinstance(geojson_data, dict):
@@ -24,44 +145,25 @@ def extract_geometry_from_geojson(geojson_data):
 
     geom_type = geojson_data.get('type')
 
-    if geom_type == 'FeatureCollection':
-        features = geojson_data.get('features', [])
-        if not features:
-            raise ValueError("FeatureCollection não contém features")
-
-        if len(features) == 1:
-            geometry = features[0].get('geometry')
-            if not geometry:
-                raise ValueError("Feature não contém geometria")
-            return json.dumps(geometry)
-        else:
-            geometries = []
-            for feature in features:
-                geom = feature.get('geometry')
-                if geom:
-                    geometries.append(geom)
-
-            if not geometries:
-                raise ValueError(
-                    "Nenhuma geometria válida encontrada nas features")
-
-            geometry_collection = {
-                "type": "GeometryCollection",
-                "geometries": geometries
-            }
-            return json.dumps(geometry_collection)
-
-    elif geom_type == 'Feature':
-        geometry = geojson_data.get('geometry')
-        if not geometry:
-            raise ValueError("Feature não contém geometria")
-        return json.dumps(geometry)
+    handler = _GEOJSON_HANDLERS.get(geom_type)
+    if handler:
+        original = geojson_data if geom_type == 'FeatureCollection' else None
+        return handler(geojson_data), original
+    if geom_type in _GEOMETRY_TYPES:
+        return geojson_data, None
 
-    elif geom_type in ['Point', 'LineString', 'Polygon', 'MultiPoint', 'MultiLineString', 'MultiPolygon', 'GeometryCollection']:
-        return json.dumps(geojson_data)
+    raise ValueError(f"Tipo de GeoJSON não suportado: {geom_type}")
 
-    else:
-        raise ValueError(f"Tipo de GeoJSON não suportado: {geom_type}")
+def _com_geojson(record) -> Dict:
+    """
+    Converte o registro em dict, trocando a geometria Shapely (decodificada do
+    WKB pelo codec da conexão) pelo dict GeoJSON esperado pela API.
+    """
+    row_dict = dict(record)
+    if 'geometria' in row_dict:
+        geometria = row_dict['geometria']
+        row_dict['geometria'] = mapping(geometria) if geometria is not None else {}
+    return row_dict
 
 # --- Queries CRUD ---
 @with_db_connection
@@ -74,52 +176,29 @@ async def criar_roi(
     """
     Cria uma nova ROI no banco de dados
     """
-    try:
-        metadata = roi_data.get('metadata', {})
-        if isinstance(metadata, dict):
-            metadata = json.dumps(metadata)
-
-        geometria_original = roi_data['geometria']
-        geometria_para_postgis = extract_geometry_from_geojson(
-            geometria_original)
-
-        metadata_dict = json.loads(metadata) if isinstance(
-            metadata, str) else metadata
-
-        if isinstance(geometria_original, dict) and geometria_original.get('type') == 'FeatureCollection':
-            metadata_dict['feature_collection_original'] = geometria_original
-        elif isinstance(geometria_original, str):
-            try:
-                parsed_geom = json.loads(geometria_original)
-                if parsed_geom.get('type') == 'FeatureCollection':
-                    metadata_dict['feature_collection_original'] = parsed_geom
-            except json.JSONDecodeError:
-                pass
-
-        metadata = json.dumps(metadata_dict)
-
-        result = await conn.fetchrow(
-            """
-            INSERT INTO regiao_de_interesse 
-            (user_id, nome, descricao, geometria, tipo_origem, metadata, sistema_referencia,
-             nome_arquivo_original, arquivos_relacionados)
-            VALUES ($1, $2, $3, ST_GeomFromGeoJSON($4), $5, $6::jsonb, 'EPSG:4326', $7, $8::jsonb)
-            RETURNING roi_id, nome, ST_AsGeoJSON(geometria)::json as geometria, 
-                      tipo_origem, status, data_criacao, nome_arquivo_original, metadata
-            """,
-            user_id,
-            roi_data['nome'],
-            roi_data.get('descricao', ''),
-            geometria_para_postgis,
-            roi_data['tipo_origem'],
-            metadata,
-            roi_data.get('nome_arquivo_original'),
-            json.dumps(roi_data.get('arquivos_relacionados', {}))
-        )
-        return dict(result)
-    except Exception as e:
-        logger.error(f"Erro ao criar ROI: {str(e)}", exc_info=True)
-        raise
+    metadata_dict = roi_data.get('metadata') or {}
+
+    geometria_para_postgis, feature_collection_original = extract_geometry_from_geojson(
+        roi_data['geometria'])
+
+    # Para geometrias simples (o caso comum) nada é duplicado nos metadados
+    if feature_collection_original is not None:
+        metadata_dict = dict(metadata_dict)
+        metadata_dict['feature_collection_original'] = feature_collection_original
+
+    # Os dicts vão direto para as colunas jsonb pelo codec binário da conexão
+    stmt = await get_statement(conn, "insert_roi")
+    result = await stmt.fetchrow(
+        user_id,
+        roi_data['nome'],
+        roi_data.get('descricao', ''),
+        shape(geometria_para_postgis),
+        roi_data['tipo_origem'],
+        metadata_dict,
+        roi_data.get('nome_arquivo_original'),
+        roi_data.get('arquivos_relacionados', {})
+    )
+    return _com_geojson(result)
 
 
 
@@ -140,82 +219,112 @@ async def criar_propriedade_e_talhoes(
         prop_metadata['nome_arquivo_original'] = shp_filename
         prop_metadata.pop('feature_collection_talhoes', None)
 
-        prop_insert_query = """
-        INSERT INTO regiao_de_interesse (user_id, nome, descricao, geometria, tipo_origem, metadata, sistema_referencia, nome_arquivo_original, tipo_roi, nome_propriedade)
-        VALUES ($1, $2, $3, ST_GeomFromGeoJSON($4), $5, $6::jsonb, 'EPSG:4326', $7, 'PROPRIEDADE', $8)
-        RETURNING roi_id, nome, data_criacao, nome_propriedade;
-        """
-        prop_geom_json = json.dumps(property_data['geometria'])
-        created_prop = await conn.fetchrow(
-            prop_insert_query, user_id, property_data['nome'], property_data['descricao'],
-            prop_geom_json, 'shapefile_hierarchical', json.dumps(
-                prop_metadata),
+        # Geometrias vão como WKB e metadados como jsonb binário (codecs da conexão)
+        prop_stmt = await get_statement(conn, "insert_propriedade")
+        created_prop = await prop_stmt.fetchrow(
+            user_id, property_data['nome'], property_data['descricao'],
+            shape(property_data['geometria']), 'shapefile_hierarchical', prop_metadata,
             shp_filename, property_data['nome_propriedade']
         )
         parent_roi_id = created_prop['roi_id']
         logger.info(
             f"ROI de Propriedade '{created_prop['nome']}' criada com ID: {parent_roi_id}")
 
-        plot_insert_query = """
-        INSERT INTO regiao_de_interesse (user_id, nome, descricao, geometria, tipo_origem, metadata, sistema_referencia, nome_arquivo_original, tipo_roi, nome_propriedade, nome_talhao, roi_pai_id)
-        VALUES ($1, $2, $3, ST_GeomFromGeoJSON($4), $5, $6::jsonb, 'EPSG:4326', $7, 'TALHAO', $8, $9, $10);
-        """
-        for plot in plots_data:
-            await conn.execute(
-                plot_insert_query, user_id, plot['nome'], plot['descricao'], json.dumps(
-                    plot['geometria']),
-                'shapefile_hierarchical', json.dumps(
-                    plot.get('metadata', {})), shp_filename,
-                property_data['nome_propriedade'], plot['nome_talhao'], parent_roi_id
-            )
-
-        talhoes_from_db = await conn.fetch("""
-            SELECT roi_id, nome_talhao, ST_AsGeoJSON(geometria) as geometria_geojson, metadata
-            FROM regiao_de_interesse
-            WHERE roi_pai_id = $1 AND user_id = $2 AND tipo_roi = 'TALHAO'
-        """, parent_roi_id, user_id)
-
-        features = []
-        for talhao in talhoes_from_db:
-            feature_properties = {
-                "roi_id": talhao['roi_id'],
-                "nome_talhao": str(talhao['nome_talhao'])
-            }
-
-            talhao_metadata = talhao.get('metadata')
-
-            parsed_metadata = {}
-            if isinstance(talhao_metadata, str):
-                try:
-                    parsed_metadata = json.loads(talhao_metadata)
-                except json.JSONDecodeError:
-                    logger.warning(
-                        f"Metadados do talhão ID {talhao['roi_id']} é uma string JSON malformada.")
-            elif isinstance(talhao_metadata, dict):
-                parsed_metadata = talhao_metadata
-
-            feature_properties.update(parsed_metadata)
-
-            feature = {
-                "type": "Feature",
-                "geometry": json.loads(talhao['geometria_geojson']),
-                "properties": feature_properties
-            }
-            features.append(feature)
-
-        final_feature_collection = {
-            "type": "FeatureCollection", "features": features}
-
-        await conn.execute("""
-            UPDATE regiao_de_interesse
-            SET metadata = metadata || jsonb_build_object('feature_collection_talhoes', $1::jsonb)
-            WHERE roi_id = $2
-        """, json.dumps(final_feature_collection), parent_roi_id)
+        plots_stmt = await get_statement(conn, "insert_talhoes")
+        talhoes_from_db = await plots_stmt.fetch(
+            user_id, 'shapefile_hierarchical', shp_filename,
+            property_data['nome_propriedade'], parent_roi_id,
+            [plot['nome'] for plot in plots_data],
+            [plot['descricao'] for plot in plots_data],
+            [shape(plot['geometria']) for plot in plots_data],
+            [plot.get('metadata', {}) for plot in plots_data],
+            [plot['nome_talhao'] for plot in plots_data]
+        )
 
         logger.info(
-            f"Metadados da Propriedade ID {parent_roi_id} atualizados com a FeatureCollection completa.")
+            f"{len(talhoes_from_db)} talhões criados e FeatureCollection gravada na Propriedade ID {parent_roi_id}.")
+
+        # Os Records são devolvidos sem cópia: o serviço só lê campos e conta os talhões
+        return {"propriedade": created_prop, "talhoes": talhoes_from_db}
+
+
+_LISTAR_ROIS_WHERE = """
+    WHERE user_id = $1{tipo}
+      AND ($2::text IS NULL OR nome_propriedade = $2)
+      AND ($3::text IS NULL OR EXISTS (
+            SELECT 1 FROM regiao_de_interesse talhoes
+            WHERE talhoes.roi_pai_id = regiao_de_interesse.roi_id
+              AND talhoes.metadata->>'variedade' ILIKE $3
+      ))
+"""
+
+_LISTAR_ROIS_GEOMETRIA = """
+           CASE WHEN ${p}::float8 IS NULL THEN geometria
+                ELSE ST_SimplifyPreserveTopology(geometria, ${p}) END as geometria,"""
+
+# Paginação: por OFFSET ou por chave a partir do cursor. São statements
+# distintos para que o predicado do cursor seja sempre uma condição de índice,
+# mesmo quando o Postgres passa a usar o plano genérico do statement preparado.
+_LISTAR_ROIS_PAGINACAO = {
+    False: ("""\
+    ORDER BY data_criacao DESC, roi_id DESC
+    LIMIT $4 OFFSET $5
+""", 6),
+    True: ("""\
+      AND (data_criacao, roi_id) < ($4, $5)
+    ORDER BY data_criacao DESC, roi_id DESC
+    LIMIT $6
+""", 7),
+}
+
+
+def _registrar_listagem_rois():
+    """
+    Registra as variantes estáticas da listagem de ROIs, uma por combinação de
+    (apenas_propriedades, include_geometry, com_cursor). Os filtros opcionais
+    usam parâmetros NULL, então o texto SQL de cada variante nunca muda e o
+    statement preparado na conexão é sempre reaproveitado.
+    """
+    for apenas_propriedades in (True, False):
+        tipo = "\n      AND tipo_roi = 'PROPRIEDADE'" if apenas_propriedades else ""
+        where = _LISTAR_ROIS_WHERE.format(tipo=tipo)
+        register_statement(
+            f"listar_rois_count_{apenas_propriedades:d}",
+            "SELECT COUNT(*) FROM regiao_de_interesse" + where
+        )
+        for include_geometry in (True, False):
+            for com_cursor, (paginacao, param_tolerancia) in _LISTAR_ROIS_PAGINACAO.items():
+                geometria = _LISTAR_ROIS_GEOMETRIA.format(p=param_tolerancia) if include_geometry else ""
+                register_statement(
+                    f"listar_rois_{apenas_propriedades:d}{include_geometry:d}{com_cursor:d}",
+                    f"""
+    SELECT roi_id, nome, descricao, tipo_origem, status,{geometria}
+           data_criacao, data_modificacao, tipo_roi, roi_pai_id,
+           nome_propriedade, nome_talhao
+    FROM regiao_de_interesse""" + where + paginacao
+                )
+
+
+_registrar_listagem_rois()
+
+
+_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-        return {"propriedade": dict(created_prop), "talhoes": [dict(t) for t in talhoes_from_db]}
+
+def encode_roi_cursor(data_criacao: datetime, roi_id: int) -> str:
+    """
+    Cursor opaco da listagem: a chave (data_criacao, roi_id) da última linha.
+    A data vai em microssegundos inteiros desde a época (a precisão do
+    Postgres), sem perda e sem caracteres que precisem de escape na URL.
+    """
+    micros = (data_criacao - _CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{roi_id}"
+
+
+def decode_roi_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverso de 'encode_roi_cursor'; levanta ValueError se o cursor for inválido."""
+    micros, _, roi_id = cursor.partition('_')
+    return _CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(roi_id)
 
 
 @with_db_connection
@@ -226,63 +335,67 @@ async def listar_rois_usuario(
     offset: int = 0,
     apenas_propriedades: bool = True,
     filtro_variedade: Optional[str] = None,
-    filtro_propriedade: Optional[str] = None
+    filtro_propriedade: Optional[str] = None,
+    include_geometry: bool = False,
+    simplify_tolerance: Optional[float] = None,
+    cursor: Optional[Tuple[datetime, int]] = None
 ) -> Dict[str, Any]:
     """
     Lista as ROIs de um usuário com filtros, contagem total e paginação.
-    Esta versão foi refatorada para construir a query dinâmica de forma segura.
-    """
-    try:
-        where_clauses = ["user_id = $1", "tipo_roi = 'PROPRIEDADE'"]
-        count_params = [user_id]
-        data_params = [user_id]
-
-        if filtro_propriedade:
-            propriedade_filter_clause = f"nome_propriedade = ${len(data_params) + 1}"
-            where_clauses.append(propriedade_filter_clause)
-            count_params.append(filtro_propriedade)
-            data_params.append(filtro_propriedade)
-
-        if filtro_variedade:
-            variedade_filter_clause = f"""
-            EXISTS (
-                SELECT 1 FROM regiao_de_interesse talhoes
-                WHERE talhoes.roi_pai_id = regiao_de_interesse.roi_id
-                AND talhoes.metadata->>'variedade' ILIKE ${len(data_params) + 1}
-            )
-            """
-            where_clauses.append(variedade_filter_clause)
-            filter_value = f"%{filtro_variedade}%"
-            count_params.append(filter_value)
-            data_params.append(filter_value)
-
-        final_where_clause = " WHERE " + " AND ".join(where_clauses)
-
-        count_query = f"SELECT COUNT(*) FROM regiao_de_interesse{final_where_clause}"
-        total_records = await conn.fetchval(count_query, *count_params)
-
-        if total_records == 0:
-            return {"total": 0, "rois": []}
-
-        select_query = """
-            SELECT roi_id, nome, descricao, tipo_origem, status,
-                   data_criacao, data_modificacao, tipo_roi, roi_pai_id,
-                   nome_propriedade, nome_talhao
-            FROM regiao_de_interesse
-        """
 
-        pagination_clause = f" ORDER BY data_criacao DESC LIMIT ${len(data_params) + 1} OFFSET ${len(data_params) + 2}"
-        data_params.extend([limit, offset])
+    A geometria só é serializada pelo PostGIS quando 'include_geometry' é True;
+    'simplify_tolerance' reduz o número de vértices enviados para o mapa.
+
+    Com 'cursor' (o 'next_cursor' da página anterior, já decodificado) a
+    paginação é por chave: o índice (user_id, data_criacao DESC, roi_id DESC)
+    é lido a partir do cursor, sem percorrer as linhas puladas pelo OFFSET,
+    que é ignorado (o router rejeita cursor com offset). O roi_id desempata
+    as ROIs criadas na mesma transação (mesmo NOW()), que de outro modo
+    seriam puladas entre páginas.
+    """
+    filter_params = (
+        user_id,
+        filtro_propriedade or None,
+        f"%{filtro_variedade}%" if filtro_variedade else None,
+    )
+
+    count_stmt = await get_statement(conn, f"listar_rois_count_{apenas_propriedades:d}")
+    total_records = await count_stmt.fetchval(*filter_params)
+
+    if total_records == 0:
+        return {"total": 0, "rois": [], "next_cursor": None}
 
-        final_data_query = select_query + final_where_clause + pagination_clause
+    if cursor is not None:
+        data_params = filter_params + (cursor[0], cursor[1], limit)
+    else:
+        data_params = filter_params + (limit, offset)
+    if include_geometry:
+        data_params += (simplify_tolerance or None,)
+
+    data_stmt = await get_statement(
+        conn, f"listar_rois_{apenas_propriedades:d}{include_geometry:d}{cursor is not None:d}")
+    results = await data_stmt.fetch(*data_params)
+
+    next_cursor = None
+    if len(results) == limit:
+        next_cursor = encode_roi_cursor(results[-1]['data_criacao'], results[-1]['roi_id'])
+    return {"total": total_records, "rois": [_com_geojson(row) for row in results], "next_cursor": next_cursor}
 
-        results = await conn.fetch(final_data_query, *data_params)
 
-        return {"total": total_records, "rois": [dict(row) for row in results]}
+def _roi_detalhada(record) -> Dict:
+    """
+    Monta o dict de detalhe de uma ROI; para propriedades, a geometria exposta
+    é a FeatureCollection dos talhões guardada nos metadados.
+    """
+    row_dict = _com_geojson(record)
+    # O codec jsonb registrado no pool já entrega 'metadata' como dict
+    metadata = row_dict.get('metadata') or {}
+    row_dict['metadata'] = metadata
+
+    if row_dict.get('tipo_roi') == 'PROPRIEDADE' and 'feature_collection_talhoes' in metadata:
+        row_dict['geometria'] = metadata['feature_collection_talhoes']
 
-    except Exception as e:
-        logger.error(f"Erro ao listar ROIs: {str(e)}", exc_info=True)
-        raise
+    return row_dict
 
 
 @with_db_connection
@@ -290,67 +403,30 @@ async def obter_roi_por_id(conn, roi_id: int, user_id: int) -> Optional[Dict]:
     """
     Obtém uma ROI específica verificando o proprietário
     """
-    try:
-        result = await conn.fetchrow(
-            """
-            SELECT roi_id, nome, descricao, ST_AsGeoJSON(geometria)::json as geometria,
-                   tipo_origem, status, data_criacao, data_modificacao, metadata, tipo_roi, nome_propriedade
-            FROM regiao_de_interesse
-            WHERE roi_id = $1 AND user_id = $2
-            """,
-            roi_id, user_id
-        )
-        if not result:
-            return None
-
-        row_dict = dict(result)
-        metadata = row_dict.get('metadata')
-        
-        if isinstance(metadata, str):
-            try:
-                metadata = json.loads(metadata)
-            except json.JSONDecodeError:
-                metadata = {}
-        elif metadata is None:
-            metadata = {}
-            
-        row_dict['metadata'] = metadata
-
-        if row_dict.get('tipo_roi') == 'PROPRIEDADE' and 'feature_collection_talhoes' in metadata:
-            row_dict['geometria'] = metadata['feature_collection_talhoes']
-
-        return row_dict
-    except Exception as e:
-        logger.error(f"Erro ao obter ROI: {str(e)}", exc_info=True)
-        raise
+    stmt = await get_statement(conn, "select_roi_by_id")
+    result = await stmt.fetchrow(roi_id, user_id)
+    return _roi_detalhada(result) if result else None
 
 
 @with_db_connection
 async def atualizar_roi(conn, roi_id: int, user_id: int, update_data: Dict) -> Optional[Dict]:
     """
-    Atualiza os metadados de uma ROI
-    """
-    try:
-        result = await conn.fetchrow(
-            """
-            UPDATE regiao_de_interesse
-            SET nome = COALESCE($3, nome),
-                descricao = COALESCE($4, descricao),
-                status = COALESCE($5, status),
-                data_modificacao = CURRENT_TIMESTAMP
-            WHERE roi_id = $1 AND user_id = $2
-            RETURNING roi_id, nome, descricao, status, data_modificacao
-            """,
-            roi_id,
-            user_id,
-            update_data.get('nome'),
-            update_data.get('descricao'),
-            update_data.get('status')
-        )
-        return dict(result) if result else None
-    except Exception as e:
-        logger.error(f"Erro ao atualizar ROI: {str(e)}", exc_info=True)
-        raise
+    Atualiza os metadados de uma ROI e retorna a ROI completa, no mesmo
+    formato de 'obter_roi_por_id'
+    """
+    # Só as colunas informadas entram no SET; a ordem fixa da lista mantém
+    # o texto SQL estável, e cada variante fica no cache de statements do asyncpg
+    colunas = tuple(
+        coluna for coluna in _COLUNAS_ATUALIZAVEIS_ROI
+        if update_data.get(coluna) is not None
+    )
+    result = await conn.fetchrow(
+        _sql_update_roi(colunas),
+        roi_id,
+        user_id,
+        *(update_data[coluna] for coluna in colunas)
+    )
+    return _roi_detalhada(result) if result else None
 
 
 @with_db_connection
@@ -358,15 +434,28 @@ async def deletar_roi(conn, roi_id: int, user_id: int) -> bool:
     """
     Remove uma ROI do banco de dados
     """
-    try:
-        result = await conn.execute(
-            "DELETE FROM regiao_de_interesse WHERE roi_id = $1 AND user_id = $2",
-            roi_id, user_id
-        )
-        return result == "DELETE 1"
-    except Exception as e:
-        logger.error(f"Erro ao deletar ROI: {str(e)}", exc_info=True)
-        raise
+    deleted_id = await conn.fetchval(
+        "DELETE FROM regiao_de_interesse WHERE roi_id = $1 AND user_id = $2 RETURNING roi_id",
+        roi_id, user_id
+    )
+    return deleted_id is not None
+
+
+@with_db_connection
+async def deletar_roi_cascade(conn, roi_id: int, user_id: int) -> List[int]:
+    """
+    Remove uma ROI e todas as suas filhas (ex.: propriedade e talhões) em uma
+    única ida ao banco. Retorna os IDs removidos.
+    """
+    results = await conn.fetch(
+        """
+        DELETE FROM regiao_de_interesse
+        WHERE (roi_id = $1 OR roi_pai_id = $1) AND user_id = $2
+        RETURNING roi_id
+        """,
+        roi_id, user_id
+    )
+    return [row['roi_id'] for row in results]
 
 
 @with_db_connection
@@ -374,22 +463,17 @@ async def listar_propriedades_unicas(conn, user_id: int) -> List[str]:
     """
     Busca e retorna uma lista de nomes de propriedades únicos para um usuário.
     """
-    try:
-        query = """
-            SELECT DISTINCT nome_propriedade
-            FROM regiao_de_interesse
-            WHERE user_id = $1
-              AND tipo_roi = 'PROPRIEDADE'
-              AND nome_propriedade IS NOT NULL
-              AND TRIM(nome_propriedade) <> ''
-            ORDER BY nome_propriedade;
-        """
-        results = await conn.fetch(query, user_id)
-        return [row['nome_propriedade'] for row in results]
-    except Exception as e:
-        logger.error(
-            f"Erro ao listar propriedades únicas: {str(e)}", exc_info=True)
-        raise
+    query = """
+        SELECT DISTINCT nome_propriedade
+        FROM regiao_de_interesse
+        WHERE user_id = $1
+          AND tipo_roi = 'PROPRIEDADE'
+          AND nome_propriedade IS NOT NULL
+          AND TRIM(nome_propriedade) <> ''
+        ORDER BY nome_propriedade;
+    """
+    results = await conn.fetch(query, user_id)
+    return [row['nome_propriedade'] for row in results]
 
 
 @with_db_connection
@@ -398,32 +482,27 @@ async def listar_variedades_unicas(conn, user_id: int) -> List[str]:
     Busca e retorna uma lista de nomes de variedades únicos para um usuário,
     garantindo que o campo 'variedade' seja extraído corretamente dos metadados dos talhões.
     """
-    try:
-        query = """
-            SELECT DISTINCT metadata->>'variedade' AS variedade
-            FROM regiao_de_interesse
-            WHERE user_id = $1
-              AND tipo_roi = 'TALHAO'
-              AND metadata ? 'variedade'
-              AND metadata->>'variedade' IS NOT NULL
-              AND TRIM(metadata->>'variedade') <> ''
-            ORDER BY variedade;
-        """
-        results = await conn.fetch(query, user_id)
+    query = """
+        SELECT DISTINCT metadata->>'variedade' AS variedade
+        FROM regiao_de_interesse
+        WHERE user_id = $1
+          AND tipo_roi = 'TALHAO'
+          AND metadata ? 'variedade'
+          AND metadata->>'variedade' IS NOT NULL
+          AND TRIM(metadata->>'variedade') <> ''
+        ORDER BY variedade;
+    """
+    results = await conn.fetch(query, user_id)
 
-        variedades_encontradas = [row['variedade'] for row in results]
-        logger.info(
-            f"Variedades únicas encontradas no banco: {variedades_encontradas}")
+    variedades_encontradas = [row['variedade'] for row in results]
+    logger.info(
+        f"Variedades únicas encontradas no banco: {variedades_encontradas}")
 
-        return variedades_encontradas
-    except Exception as e:
-        logger.error(
-            f"Erro ao listar variedades únicas: {str(e)}", exc_info=True)
-        raise
+    return variedades_encontradas
 
 
 @with_db_connection
-async def listar_talhoes_por_variedade(conn, user_id: int, variedade: str) -> List[Dict]:
+async def listar_talhoes_por_variedade(conn, user_id: int, variedade: str) -> List[asyncpg.Record]:
     """
     Busca os dados (id, nome, geometria) de todos os talhões de um usuário 
     que correspondem a uma variedade específica.
@@ -440,7 +519,7 @@ async def listar_talhoes_por_variedade(conn, user_id: int, variedade: str) -> Li
     """
     results = await conn.fetch(query, user_id, f"%{variedade}%")
 
-    return [dict(row) for row in results]
+    return results
 
 
 @with_db_connection
@@ -451,7 +530,7 @@ async def listar_talhoes_por_propriedade(conn, propriedade_id: int, user_id: int
     query = """
         SELECT 
             roi_id, nome, descricao, 
-            COALESCE(ST_AsGeoJSON(geometria)::json, '{}'::json) as geometria,
+            geometria,
             tipo_origem, status, data_criacao, data_modificacao,
             tipo_roi, roi_pai_id, nome_propriedade, nome_talhao
         FROM regiao_de_interesse
@@ -459,10 +538,10 @@ async def listar_talhoes_por_propriedade(conn, propriedade_id: int, user_id: int
         ORDER BY nome_talhao;
     """
     results = await conn.fetch(query, user_id, propriedade_id)
-    return [dict(row) for row in results]
+    return [_com_geojson(row) for row in results]
 
 @with_db_connection
-async def listar_talhoes_por_propriedade_e_variedade(conn, user_id: int, propriedade_id: int, variedade: str) -> List[Dict]:
+async def listar_talhoes_por_propriedade_e_variedade(conn, user_id: int, propriedade_id: int, variedade: str) -> List[asyncpg.Record]:
     """
     Busca os IDs de todos os talhões de um usuário que correspondem
     a uma propriedade e variedade específicas.
@@ -476,7 +555,17 @@ async def listar_talhoes_por_propriedade_e_variedade(conn, user_id: int, proprie
           AND metadata->>'variedade' ILIKE $3;
     """
     results = await conn.fetch(query, user_id, propriedade_id, f"%{variedade}%")
-    return [dict(row) for row in results]
+    return results
+
+SQL_SELECT_ROIS_PARA_BATCH = """
+    SELECT
+        roi_id, nome, geometria, COALESCE(metadata, '{}'::jsonb) as metadata,
+        nome_propriedade, nome_talhao
+    FROM regiao_de_interesse
+    WHERE user_id = $1 AND roi_id = ANY($2::int[])
+    ORDER BY roi_id
+"""
+
 
 @with_db_connection
 async def listar_rois_por_ids_para_batch(conn, roi_ids: List[int], user_id: int) -> List[Dict]:
@@ -485,41 +574,29 @@ async def listar_rois_por_ids_para_batch(conn, roi_ids: List[int], user_id: int)
     verificando a propriedade do usuário e garantindo que os metadados sejam dicionários.
     Otimizado para processos em lote.
     """
-    try:
-        if not roi_ids:
-            return []
+    if not roi_ids:
+        return []
 
-        query = """
-            SELECT
-                roi_id, nome, ST_AsGeoJSON(geometria)::json as geometria, metadata,
-                nome_propriedade, nome_talhao
-            FROM regiao_de_interesse
-            WHERE user_id = $1 AND roi_id = ANY($2::int[]);
-        """
-        rois_records = await conn.fetch(query, user_id, roi_ids)
-        
-        processed_rois = []
-        for record in rois_records:
-            row_dict = dict(record)
-            metadata = row_dict.get('metadata')
-            
-            if isinstance(metadata, str):
-                try:
-                    row_dict['metadata'] = json.loads(metadata)
-                except json.JSONDecodeError:
-                    logger.warning(f"Metadados da ROI {row_dict['roi_id']} são uma string JSON malformada. Retornando como dict vazio.")
-                    row_dict['metadata'] = {}
-            elif metadata is None:
-                row_dict['metadata'] = {}
-            
-            processed_rois.append(row_dict)
-            
-        return processed_rois
-    except Exception as e:
-        logger.error(f"Erro ao buscar ROIs em lote: {str(e)}", exc_info=True)
-        raise
-
-async def get_talhoes_agrupados_para_programacao(conn: asyncpg.Connection, user_id: int) -> List[Dict]:
+    rois_records = await conn.fetch(SQL_SELECT_ROIS_PARA_BATCH, user_id, roi_ids)
+    return [_com_geojson(record) for record in rois_records]
+
+
+async def iterar_rois_por_ids_para_batch(
+    conn: asyncpg.Connection, roi_ids: List[int], user_id: int, prefetch: int = 200
+) -> AsyncIterator[Dict]:
+    """
+    Versão em streaming de 'listar_rois_por_ids_para_batch' para tarefas em lote
+    que já possuem uma conexão: as linhas são lidas por um cursor no servidor,
+    'prefetch' por vez, em vez de carregar todas as geometrias na memória.
+    """
+    if not roi_ids:
+        return
+
+    async with conn.transaction():
+        async for record in conn.cursor(SQL_SELECT_ROIS_PARA_BATCH, user_id, roi_ids, prefetch=prefetch):
+            yield _com_geojson(record)
+
+async def get_talhoes_agrupados_para_programacao(conn: asyncpg.Connection, user_id: int) -> List[asyncpg.Record]:
     """
     Busca todos os talhões de um usuário, incluindo dados da propriedade pai
     e a variedade dos metadados, para permitir o agrupamento.
@@ -547,4 +624,4 @@ async def get_talhoes_agrupados_para_programacao(conn: asyncpg.Connection, user_
             p.nome_propriedade, variedade, t.nome_talhao;
     """
     results = await conn.fetch(query, user_id)
-    return [dict(row) for row in results]
\ No newline at end of file
+    return results
@@ -89,14 +89,26 @@ async def get_status_options():
 @router.get("/", response_model=schemas.ROIListResponse, summary="Lista as ROIs do usuário")
 async def listar_minhas_rois(
     current_user: dict = Depends(get_current_user), limit: int = 10, offset: int = 0,
-    propriedade: Optional[str] = Query(None), variedade: Optional[str] = Query(None)
+    propriedade: Optional[str] = Query(None), variedade: Optional[str] = Query(None),
+    include_geometry: bool = Query(False, description="Inclui a geometria (GeoJSON) de cada ROI."),
+    simplify_tolerance: Optional[float] = Query(None, gt=0, description="Tolerância de simplificação da geometria, em graus."),
+    cursor: Optional[str] = Query(None, description="'next_cursor' da página anterior (paginação por chave).")
 ):
     """Lista todas as ROIs do usuário com paginação, filtros e contagem total."""
+    if cursor and offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Use 'cursor' ou 'offset', não ambos.")
     # LÓGICA MOVIDA PARA O SERVIÇO
-    return await roi_service.get_user_rois(
-        user_id=current_user['id'], limit=limit, offset=offset,
-        filtro_propriedade=propriedade, filtro_variedade=variedade
-    )
+    try:
+        return await roi_service.get_user_rois(
+            user_id=current_user['id'], limit=limit, offset=offset,
+            filtro_propriedade=propriedade, filtro_variedade=variedade,
+            include_geometry=include_geometry, simplify_tolerance=simplify_tolerance,
+            cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor de paginação inválido.")
 
 
 @router.get("/propriedades-disponiveis", response_model=List[str], summary="Lista propriedades únicas")
@@ -43,6 +43,7 @@ class LoteProcessamentoRequest(BaseModel):
 class ROIListResponse(BaseModel):
     total: int
     rois: List[ROIResponse]
+    next_cursor: Optional[str] = None
 
 
 class DownloadRequest(BaseModel):
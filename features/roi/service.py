@@ -1,4 +1,4 @@
-import json
+import asyncio
 import os
 import shutil
 import logging
@@ -11,14 +11,15 @@ from fastapi import UploadFile
 from shapely.geometry import shape, mapping
 from shapely.ops import unary_union
 
-from utils.upload_utils import save_uploaded_files, cleanup_temp_files
+from utils.upload_utils import save_uploaded_files_async, cleanup_temp_files_async
 from services.shapefile_service import ShapefileSplitterProcessor
 from features.gee.service import gee_service
 from features.jobs.queries import update_job_status
 from uuid import UUID
 from utils.text_normalizer import normalize_name
+from utils.json_utils import json_loads, JSONDecodeError
 from . import queries, schemas
-from database.session import with_db_connection, get_db_connection
+from database.session import with_db_connection, get_db_connection, get_or_create_pool
 import asyncpg
 
 logger = logging.getLogger(__name__)
@@ -50,8 +51,8 @@ class ROIService:
         for key in ['geometria', 'metadata']:
             if processed.get(key) and isinstance(processed[key], str):
                 try:
-                    processed[key] = json.loads(processed[key])
-                except (json.JSONDecodeError, TypeError):
+                    processed[key] = json_loads(processed[key])
+                except (JSONDecodeError, TypeError):
                     processed[key] = {} if key == 'metadata' else None
 
         return processed
@@ -60,7 +61,7 @@ class ROIService:
         """Orquestra o upload, processamento e criação de ROIs a partir de um shapefile."""
         temp_dir = None
         try:
-            temp_dir = save_uploaded_files([f for f in files.values() if f])
+            temp_dir = await save_uploaded_files_async([f for f in files.values() if f])
 
             processor = ShapefileSplitterProcessor()
             hierarchical_data = await processor.process(temp_dir, property_col=propriedade_col, plot_col=talhao_col)
@@ -69,14 +70,12 @@ class ROIService:
                 raise ValueError(
                     "Nenhuma propriedade ou talhão válido encontrado para criar ROIs.")
 
-            total_props_criadas = 0
-            total_talhoes_criados = 0
-            response_details = []
-
+            shp_filename = files['shp'].filename
+            jobs = []
             for prop_info in hierarchical_data:
                 prop_data_for_db = {
-                    "nome": self._generate_roi_name(files['shp'].filename, prop_info['nome_propriedade'], "PROP"),
-                    "descricao": f"Propriedade '{prop_info['nome_propriedade']}' importada do arquivo {files['shp'].filename}.",
+                    "nome": self._generate_roi_name(shp_filename, prop_info['nome_propriedade'], "PROP"),
+                    "descricao": f"Propriedade '{prop_info['nome_propriedade']}' importada do arquivo {shp_filename}.",
                     "nome_propriedade": prop_info['nome_propriedade'],
                     "geometria": prop_info['geometria'],
                     "metadata": prop_info['metadata']
@@ -88,22 +87,47 @@ class ROIService:
                     "geometria": talhao_info['geometria'],
                     "metadata": talhao_info['metadata']
                 } for talhao_info in prop_info['talhoes']]
+                jobs.append((prop_data_for_db, plots_data_for_db))
 
-                result = await queries.criar_propriedade_e_talhoes(
+            if len(jobs) == 1:
+                prop_data_for_db, plots_data_for_db = jobs[0]
+                results = [await queries.criar_propriedade_e_talhoes(
                     conn=conn,
                     user_id=user_id,
                     property_data=prop_data_for_db,
                     plots_data=plots_data_for_db,
-                    shp_filename=files['shp'].filename
-                )
+                    shp_filename=shp_filename
+                )]
+            else:
+                # As propriedades são independentes entre si: cada uma é gravada
+                # na sua própria transação, em uma conexão própria do pool, e o
+                # semáforo impede que um shapefile grande esgote o pool.
+                pool = await get_or_create_pool()
+                sem = asyncio.Semaphore(max(1, min(pool.get_max_size() // 2, 8)))
+
+                async def _criar(prop_data: Dict, plots_data: List[Dict]) -> Dict:
+                    async with sem:
+                        async with pool.acquire() as pooled_conn:
+                            return await queries.criar_propriedade_e_talhoes(
+                                conn=pooled_conn,
+                                user_id=user_id,
+                                property_data=prop_data,
+                                plots_data=plots_data,
+                                shp_filename=shp_filename
+                            )
+
+                results = await asyncio.gather(*(_criar(prop, plots) for prop, plots in jobs))
 
-                total_props_criadas += 1
+            total_talhoes_criados = 0
+            response_details = []
+            for result in results:
                 total_talhoes_criados += len(result['talhoes'])
                 response_details.append({
                     "propriedade": result['propriedade']['nome'],
                     "roi_id_propriedade": result['propriedade']['roi_id'],
                     "talhoes_criados": len(result['talhoes'])
                 })
+            total_props_criadas = len(results)
 
             return {
                 "mensagem": "Processamento hierárquico concluído com sucesso.",
@@ -113,7 +137,7 @@ class ROIService:
             }
         finally:
             if temp_dir:
-                cleanup_temp_files(temp_dir)
+                await cleanup_temp_files_async(temp_dir)
 
     async def process_batch_rois(self, *, roi_ids: List[int], user_id: int) -> Dict:
         """Combina as geometrias de uma lista de ROIs."""
@@ -135,19 +159,25 @@ class ROIService:
             "geometria_combinada": mapping(unified_geometry)
         }
 
-    async def get_user_rois(self, *, user_id: int, limit: int, offset: int, filtro_propriedade: Optional[str], filtro_variedade: Optional[str]) -> Dict:
-        """Busca ROIs de um usuário, processa os dados e retorna."""
+    async def get_user_rois(self, *, user_id: int, limit: int, offset: int, filtro_propriedade: Optional[str], filtro_variedade: Optional[str], include_geometry: bool = False, simplify_tolerance: Optional[float] = None, cursor: Optional[str] = None) -> Dict:
+        """
+        Busca ROIs de um usuário, processa os dados e retorna.
+        Levanta ValueError se o 'cursor' for inválido.
+        """
         result_db = await queries.listar_rois_usuario(
             user_id=user_id,
             limit=limit,
             offset=offset,
             filtro_propriedade=filtro_propriedade,
             filtro_variedade=filtro_variedade,
-            apenas_propriedades=True
+            apenas_propriedades=True,
+            include_geometry=include_geometry,
+            simplify_tolerance=simplify_tolerance,
+            cursor=queries.decode_roi_cursor(cursor) if cursor else None
         )
         processed_rois = [self._process_roi_data(
             roi) for roi in result_db.get("rois", [])]
-        return {"total": result_db.get("total", 0), "rois": processed_rois}
+        return {"total": result_db.get("total", 0), "rois": processed_rois, "next_cursor": result_db.get("next_cursor")}
 
     async def get_available_properties(self, *, user_id: int) -> List[str]:
         """Busca a lista de propriedades únicas para um usuário."""
@@ -170,17 +200,14 @@ class ROIService:
         if not update_dict:
             raise ValueError("Nenhum dado fornecido para atualização.")
 
+        # O UPDATE já retorna a ROI completa; não é preciso buscá-la de novo
         updated = await queries.atualizar_roi(roi_id=roi_id, user_id=user_id, update_data=update_dict)
         if not updated:
             return None
-
-        return await self.get_roi_by_id(roi_id=roi_id, user_id=user_id)
+        return self._process_roi_data(updated)
 
     async def delete_roi(self, *, roi_id: int, user_id: int) -> bool:
-        """Verifica se a ROI existe e então a deleta."""
-        roi_exists = await queries.obter_roi_por_id(roi_id, user_id)
-        if not roi_exists:
-            return False
+        """Deleta a ROI; retorna False se ela não existe ou não pertence ao usuário."""
         return await queries.deletar_roi(roi_id, user_id)
 
     async def get_plots_by_property(self, *, propriedade_id: int, user_id: int) -> List[Dict]:
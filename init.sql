@@ -57,7 +57,7 @@ CREATE TABLE public.regiao_de_interesse (
     sistema_referencia VARCHAR(50) DEFAULT 'EPSG:4326',
     nome_arquivo_original VARCHAR(255),
     arquivos_relacionados JSONB,
-    data_criacao TIMESTAMPTZ DEFAULT NOW(),
+    data_criacao TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     data_modificacao TIMESTAMPTZ DEFAULT NOW(),
     roi_pai_id INTEGER,
     tipo_roi VARCHAR(20),
@@ -76,7 +76,8 @@ CREATE TABLE public.analysis_jobs (
     created_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
     completed_at TIMESTAMPTZ,
     error_message TEXT,
-    parent_job_id INTEGER
+    parent_job_id INTEGER,
+    input_path TEXT
 );
 
 -- Tabela para armazenar os resultados das análises.
@@ -130,6 +131,10 @@ CREATE INDEX idx_roi_user_id ON public.regiao_de_interesse(user_id);
 CREATE INDEX idx_roi_roi_pai_id ON public.regiao_de_interesse(roi_pai_id);
 CREATE INDEX idx_roi_tipo_roi ON public.regiao_de_interesse(tipo_roi);
 CREATE INDEX idx_roi_nome_propriedade ON public.regiao_de_interesse(nome_propriedade);
+-- Listagem paginada (listar_rois_usuario): filtro por usuário ordenado pela data de criação;
+-- roi_id desempata as ROIs criadas na mesma transação (chave do cursor)
+CREATE INDEX idx_roi_user_prop_data ON public.regiao_de_interesse(user_id, data_criacao DESC, roi_id DESC) WHERE tipo_roi = 'PROPRIEDADE';
+CREATE INDEX idx_roi_user_all_data ON public.regiao_de_interesse(user_id, data_criacao DESC, roi_id DESC);
 CREATE INDEX idx_analysis_jobs_user_id ON public.analysis_jobs(user_id);
 CREATE INDEX idx_analysis_jobs_roi_id ON public.analysis_jobs(roi_id);
 
@@ -0,0 +1,34 @@
+from starlette.datastructures import Headers
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.types import ASGIApp
+
+
+class CachedCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware que reaproveita as respostas de preflight.
+
+    O Starlette já monta os cabeçalhos fixos no __init__, mas cada preflight
+    ainda copia o dicionário, valida a origem e codifica os cabeçalhos de uma
+    nova resposta. Como o resultado depende apenas da origem, do método e dos
+    cabeçalhos solicitados, a resposta já codificada é guardada por essa chave.
+    """
+
+    def __init__(self, app: ASGIApp, *args, max_cached_preflights: int = 256, **kwargs):
+        super().__init__(app, *args, **kwargs)
+        self._preflight_cache = {}
+        self._max_cached_preflights = max_cached_preflights
+
+    def preflight_response(self, request_headers: Headers) -> Response:
+        key = (
+            request_headers.get("origin"),
+            request_headers.get("access-control-request-method"),
+            request_headers.get("access-control-request-headers"),
+        )
+        response = self._preflight_cache.get(key)
+        if response is None:
+            response = super().preflight_response(request_headers=request_headers)
+            # Limita o cache para que origens arbitrárias não cresçam a memória
+            if len(self._preflight_cache) < self._max_cached_preflights:
+                self._preflight_cache[key] = response
+        return response
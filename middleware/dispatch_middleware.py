@@ -0,0 +1,28 @@
+from starlette.routing import Match, Mount
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class SubAppDispatchMiddleware:
+    """
+    Middleware ASGI puro que entrega as requisições de um prefixo direto a um
+    sub-app, antes da pilha de middlewares do app principal.
+
+    Um app.mount() é roteado dentro dessa pilha, então o sub-app ainda
+    passaria pelo TokenRefreshMiddleware e pelo CORS do app principal.
+    Registrado por último (o mais externo), este middleware desvia o prefixo
+    logo na entrada; o escopo do sub-app (root_path/path) é montado pelo
+    próprio Mount do Starlette, como no roteamento normal.
+    """
+
+    def __init__(self, app: ASGIApp, path: str, sub_app: ASGIApp):
+        self.app = app
+        self.sub_app = sub_app
+        self._mount = Mount(path, app=sub_app)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket"):
+            match, child_scope = self._mount.matches(scope)
+            if match == Match.FULL:
+                scope.update(child_scope)
+                return await self.sub_app(scope, receive, send)
+        await self.app(scope, receive, send)
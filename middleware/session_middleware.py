@@ -1,58 +1,96 @@
 import time
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.responses import Response
+from http.cookies import SimpleCookie
+
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from jose import jwt, JWTError
-from datetime import timedelta
 
-from config import settings 
-from features.auth.service import create_access_token
+from config import settings
+from features.auth.service import JWT_ALGORITHMS, create_access_token, get_jwt_key
+
+
+EXCLUDED_PATHS = ("/api/v1/auth/token", "/api/v1/auth/logout")
+
+
+class TokenRefreshMiddleware:
+    """
+    Middleware ASGI puro que renova o cookie 'access_token' quando ele
+    está próximo de expirar.
 
+    Não usa BaseHTTPMiddleware: evita a task extra e os objetos
+    Request/Response por requisição. O cabeçalho Set-Cookie é anexado
+    interceptando a mensagem 'http.response.start'.
+    """
 
-class TokenRefreshMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        response = await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        excluded_paths = ["/api/v1/auth/token", "/api/v1/auth/logout"]
-        if any(request.url.path.startswith(p) for p in excluded_paths):
-            return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PATHS):
+            return await self.app(scope, receive, send)
 
-        token = request.cookies.get("access_token")
+        token = self._get_token(scope["headers"])
+        if not token:
+            return await self.app(scope, receive, send)
 
-        if token and response.status_code < 400:
-            token = request.headers.get("Authorization")
+        email = self._email_if_near_expiry(token)
+        if not email:
+            return await self.app(scope, receive, send)
 
-            if token:
-                try:
-                    payload = jwt.decode(
-                        token, SECRET_KEY, algorithms=[ALGORITHM])
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                new_token = create_access_token(data={"sub": email})
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", self._build_cookie(new_token)))
+                message["headers"] = headers
+            await send(message)
 
-                    exp_timestamp = payload.get("exp")
-                    current_timestamp = int(time.time())
+        await self.app(scope, receive, send_wrapper)
 
-                    if exp_timestamp:
-                        time_left_seconds = exp_timestamp - current_timestamp
+    @staticmethod
+    def _get_token(headers) -> str:
+        """Lê o token do cookie 'access_token' ou, na falta dele, do cabeçalho Authorization."""
+        authorization = None
+        for name, value in headers:
+            if name == b"cookie":
+                token = cookie_parser(value.decode("latin-1")).get("access_token")
+                if token:
+                    return token
+            elif name == b"authorization":
+                authorization = value.decode("latin-1")
 
-                        if 0 < time_left_seconds < (settings.REFRESH_THRESHOLD_MINUTES * 60):
-                            email = payload.get("sub")
+        if authorization:
+            scheme, _, credentials = authorization.partition(" ")
+            if scheme.lower() == "bearer":
+                return credentials
+        return None
 
-                            if email:
-                                new_token = create_access_token(
-                                    data={"sub": email})
+    @staticmethod
+    def _email_if_near_expiry(token: str) -> str:
+        """Retorna o 'sub' do token se ele expira dentro do limite de renovação."""
+        try:
+            payload = jwt.decode(token, get_jwt_key(), algorithms=JWT_ALGORITHMS)
+        except JWTError:
+            # Se o token for inválido, não faz nada.
+            # A proteção de rota na dependência (get_current_user) já terá barrado a requisição.
+            return None
 
-                                response.set_cookie(
-                                    key="access_token",
-                                    value=new_token,
-                                    httponly=True,
-                                    # Para produção (HTTPS). Mude para False para testes em HTTP local.
-                                    samesite='lax',
-                                    secure=True,
-                                    path="/"
-                                )
+        exp_timestamp = payload.get("exp")
+        if not exp_timestamp:
+            return None
 
-                except JWTError:
-                    # Se o token for inválido, não faz nada.
-                    # A proteção de rota na dependência (get_current_user) já terá barrado a requisição.
-                    pass
+        time_left_seconds = exp_timestamp - int(time.time())
+        if 0 < time_left_seconds < (settings.REFRESH_THRESHOLD_MINUTES * 60):
+            return payload.get("sub")
+        return None
 
-        return response
+    @staticmethod
+    def _build_cookie(token: str) -> bytes:
+        cookie = SimpleCookie()
+        cookie["access_token"] = token
+        cookie["access_token"]["httponly"] = True
+        # Para produção (HTTPS). Mude para False para testes em HTTP local.
+        cookie["access_token"]["samesite"] = "lax"
+        cookie["access_token"]["secure"] = True
+        cookie["access_token"]["path"] = "/"
+        return cookie.output(header="").strip().encode("latin-1")
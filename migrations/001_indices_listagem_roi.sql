@@ -0,0 +1,13 @@
+-- Índices da listagem paginada de ROIs para bancos criados antes desta versão do init.sql.
+-- CONCURRENTLY não roda dentro de transação: execute o arquivo com psql sem -1/--single-transaction.
+
+-- listar_rois_usuario(apenas_propriedades=True): WHERE user_id = $1 AND tipo_roi = 'PROPRIEDADE' ORDER BY data_criacao DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_roi_user_prop_data
+    ON public.regiao_de_interesse(user_id, data_criacao DESC)
+    WHERE tipo_roi = 'PROPRIEDADE';
+
+-- listar_rois_usuario(apenas_propriedades=False): WHERE user_id = $1 ORDER BY data_criacao DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_roi_user_all_data
+    ON public.regiao_de_interesse(user_id, data_criacao DESC);
+
+VACUUM ANALYZE public.regiao_de_interesse;
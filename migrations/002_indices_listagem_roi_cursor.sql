@@ -0,0 +1,20 @@
+-- Inclui roi_id nos índices da listagem paginada de ROIs, para bancos criados antes desta versão do init.sql.
+-- O cursor de listar_rois_usuario passou a ser (data_criacao, roi_id): data_criacao sozinha se repete
+-- entre os talhões inseridos na mesma transação.
+-- CONCURRENTLY não roda dentro de transação: execute o arquivo com psql sem -1/--single-transaction.
+
+-- listar_rois_usuario(apenas_propriedades=True): WHERE user_id = $1 AND tipo_roi = 'PROPRIEDADE'
+-- ORDER BY data_criacao DESC, roi_id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_roi_user_prop_data_id
+    ON public.regiao_de_interesse(user_id, data_criacao DESC, roi_id DESC)
+    WHERE tipo_roi = 'PROPRIEDADE';
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_roi_user_prop_data;
+ALTER INDEX public.idx_roi_user_prop_data_id RENAME TO idx_roi_user_prop_data;
+
+-- listar_rois_usuario(apenas_propriedades=False): WHERE user_id = $1 ORDER BY data_criacao DESC, roi_id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_roi_user_all_data_id
+    ON public.regiao_de_interesse(user_id, data_criacao DESC, roi_id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_roi_user_all_data;
+ALTER INDEX public.idx_roi_user_all_data_id RENAME TO idx_roi_user_all_data;
+
+VACUUM ANALYZE public.regiao_de_interesse;
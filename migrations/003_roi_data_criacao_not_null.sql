@@ -0,0 +1,10 @@
+-- data_criacao faz parte da chave do cursor de listar_rois_usuario (data_criacao, roi_id):
+-- linhas com NULL não podem ser paginadas por chave. Preenche as existentes e
+-- torna a coluna NOT NULL, como no init.sql.
+
+UPDATE public.regiao_de_interesse
+SET data_criacao = COALESCE(data_modificacao, NOW())
+WHERE data_criacao IS NULL;
+
+ALTER TABLE public.regiao_de_interesse
+    ALTER COLUMN data_criacao SET NOT NULL;
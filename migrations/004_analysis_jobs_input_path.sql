@@ -0,0 +1,5 @@
+-- Caminho do arquivo de entrada do job (o ZIP enviado em /upload-and-analyze).
+-- O serviço de relatórios localiza as bandas por ele, como no init.sql.
+
+ALTER TABLE public.analysis_jobs
+    ADD COLUMN IF NOT EXISTS input_path TEXT;
@@ -8,15 +8,21 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Endpoint de alto volume do GEE, indicado para muitas requisições automáticas
+# em paralelo (como os downloads por data); o padrão da biblioteca enfileira mais
+HIGH_VOLUME_URL = 'https://earthengine-highvolume.googleapis.com'
+
 
 def initialize_earth_engine(json_key_path=os.getenv('EE_JSON_KEY_PATH'),
-                            service_account_email=os.getenv('DEFAULT_SERVICE_ACCOUNT')):
+                            service_account_email=os.getenv('DEFAULT_SERVICE_ACCOUNT'),
+                            api_url=os.getenv('EE_API_URL', HIGH_VOLUME_URL)):
     """
     Inicializa o Earth Engine com conta de serviço
 
     Args:
         json_key_path (str): Caminho para o arquivo JSON da chave
         service_account_email (str): Email da conta de serviço
+        api_url (str): Endpoint da API do Earth Engine (alto volume por padrão)
     """
     try:
         if not os.path.exists(json_key_path):
@@ -30,7 +36,7 @@ def initialize_earth_engine(json_key_path=os.getenv('EE_JSON_KEY_PATH'),
 
         credentials = credentials.with_subject(service_account_email)
 
-        ee.Initialize(credentials)
+        ee.Initialize(credentials, opt_url=api_url)
 
         logger.info("Earth Engine inicializado com sucesso")
         return True
@@ -1,32 +1,29 @@
 import logging
 import os
 import geopandas as gpd
-from shapely.geometry import Polygon, MultiPolygon, mapping
-from shapely.ops import unary_union
+from shapely.geometry import mapping
+from shapely.ops import transform, unary_union
 from typing import Dict, List, Any
 from pathlib import Path
-import json
 import pandas as pd
 from datetime import date
 from utils.text_normalizer import normalize_name
 
 logger = logging.getLogger(__name__)
 
+try:
+    from shapely import force_2d as _force_2d
+except ImportError:  # shapely < 2.0
+    def _force_2d(geom):
+        return transform(lambda x, y, z=None: (x, y), geom)
+
 
 def convert_3d_to_2d(geom):
     """Remove a dimensão Z de uma geometria, essencial para o GEE."""
     if geom is None or not geom.has_z:
         return geom
-
-    if isinstance(geom, Polygon):
-        exterior_2d = [(x, y) for x, y, *_ in geom.exterior.coords]
-        interiors_2d = [[(x, y) for x, y, *_ in interior.coords]
-                        for interior in geom.interiors]
-        return Polygon(exterior_2d, interiors_2d)
-    elif isinstance(geom, MultiPolygon):
-        polygons_2d = [convert_3d_to_2d(poly) for poly in geom.geoms]
-        return MultiPolygon(polygons_2d)
-    return geom
+    # Feito no GEOS, sem percorrer os vértices em Python
+    return _force_2d(geom)
 
 
 class ShapefileSplitterProcessor:
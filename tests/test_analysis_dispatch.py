@@ -0,0 +1,60 @@
+import os
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("jose")
+
+# Necessário antes de importar config/settings
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from features.auth.service import create_access_token
+from middleware.dispatch_middleware import SubAppDispatchMiddleware
+from middleware.session_middleware import TokenRefreshMiddleware
+
+
+def _build_app() -> FastAPI:
+    # Mesma montagem do app.py: TokenRefresh no app principal e o despacho
+    # do sub-app registrado por último (o mais externo)
+    main_app = FastAPI()
+    sub_app = FastAPI()
+
+    @main_app.get("/api/v1/roi/ping")
+    async def main_ping():
+        return {"app": "main"}
+
+    @sub_app.get("/ping")
+    async def sub_ping():
+        return {"app": "analysis"}
+
+    main_app.add_middleware(TokenRefreshMiddleware)
+    main_app.add_middleware(SubAppDispatchMiddleware, path="/api/v1/analysis", sub_app=sub_app)
+    return main_app
+
+
+def _near_expiry_client() -> TestClient:
+    client = TestClient(_build_app(), base_url="https://testserver")
+    # Expira dentro do limite de renovação: o TokenRefresh renovaria o cookie
+    token = create_access_token({"sub": "user@example.com"}, expires_delta=timedelta(minutes=1))
+    client.cookies.set("access_token", token)
+    return client
+
+
+def test_analysis_response_has_no_refreshed_cookie():
+    response = _near_expiry_client().get("/api/v1/analysis/ping")
+
+    assert response.status_code == 200
+    assert response.json() == {"app": "analysis"}
+    assert "set-cookie" not in response.headers
+
+
+def test_main_app_still_refreshes_cookie():
+    response = _near_expiry_client().get("/api/v1/roi/ping")
+
+    assert response.status_code == 200
+    assert "access_token=" in response.headers["set-cookie"]
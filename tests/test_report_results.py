@@ -0,0 +1,46 @@
+from datetime import date
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("fastapi")
+pytest.importorskip("fpdf")
+pytest.importorskip("matplotlib")
+pytest.importorskip("rasterio")
+
+from features.analysis.queries import _results_from_jsonb
+from services.report_generator import report_generator
+
+
+def test_results_from_jsonb_restores_dates():
+    # Formato devolvido pelo codec jsonb para o jsonb_agg de get_job_with_results
+    results = _results_from_jsonb([
+        {"job_id": 7, "date_analyzed": "2024-05-01", "predicted_atr": 131.25},
+    ])
+
+    assert results[0]["date_analyzed"] == date(2024, 5, 1)
+
+
+def test_report_generation_accepts_job_results():
+    results = _results_from_jsonb([
+        {"job_id": 7, "date_analyzed": "2024-05-01", "predicted_atr": 131.25},
+        {"job_id": 7, "date_analyzed": "2024-06-01", "predicted_atr": 140.5},
+    ])
+    roi_metadata = {
+        "roi_id": 1,
+        "nome_propriedade": "Fazenda",
+        "nome_talhao": "Talhao 1",
+        "metadata": {"area_ha": 10.0},
+    }
+
+    pdf = report_generator.generate_report(
+        job_details={"job_id": 7},
+        results=results,
+        roi_metadata=roi_metadata,
+        image_buffer=BytesIO(),
+        histogram_buffer=BytesIO(),
+        threshold=0.5,
+    )
+
+    assert pdf.getvalue().startswith(b"%PDF")
@@ -17,7 +17,8 @@ def handle_exceptions(func):
         except HTTPException as he:
             raise he
         except Exception as e:
-            logger.error(f"Erro ao executar a função: {e}", exc_info=True)
+            # O traceback já foi registrado (com amostragem) por quem capturou o erro
+            logger.error(f"Erro ao executar a função: {e}")
             raise HTTPException(
                 status_code=400, detail=f"Erro ao processar a requisição: {str(e)}"
             )
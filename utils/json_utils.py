@@ -0,0 +1,18 @@
+import orjson
+
+# orjson é uma extensão em Rust bem mais rápida que o módulo json da stdlib
+# para os GeoJSONs grandes gerados a partir de shapefiles.
+# OPT_SERIALIZE_NUMPY cobre os escalares numpy vindos do geopandas/pandas.
+_DUMPS_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+JSONDecodeError = orjson.JSONDecodeError
+
+
+def json_dumps_bytes(obj) -> bytes:
+    """Serializa um objeto para JSON em bytes."""
+    return orjson.dumps(obj, option=_DUMPS_OPTIONS)
+
+
+def json_loads(data):
+    """Desserializa JSON a partir de str ou bytes."""
+    return orjson.loads(data)
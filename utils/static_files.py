@@ -0,0 +1,37 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi.staticfiles import StaticFiles
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles que guarda o resultado de 'lookup_path' (caminho resolvido e
+    os.stat) por 'cache_ttl' segundos.
+
+    Cada requisição a /static faz a resolução do caminho e um stat() no disco;
+    uma página carrega dezenas de arquivos, quase sempre os mesmos. Dentro do
+    TTL o stat em cache é reutilizado (o ETag e o Last-Modified do FileResponse
+    saem dele), e um arquivo alterado é percebido no máximo 'cache_ttl' depois.
+    """
+
+    def __init__(self, *args, cache_ttl: float = 2.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache: Dict[str, Tuple[float, str, Optional[os.stat_result]]] = {}
+        self._ttl = cache_ttl
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        now = time.monotonic()
+        cached = self._cache.get(path)
+        if cached is not None and now - cached[0] < self._ttl:
+            return cached[1], cached[2]
+
+        full_path, stat_result = super().lookup_path(path)
+        # Só arquivos encontrados entram no cache, para que caminhos
+        # arbitrários (404) não façam o dicionário crescer
+        if stat_result is not None:
+            self._cache[path] = (now, full_path, stat_result)
+        else:
+            self._cache.pop(path, None)
+        return full_path, stat_result
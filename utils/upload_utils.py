@@ -1,12 +1,17 @@
+import asyncio
 import tempfile
 from pathlib import Path
 import shutil
 from typing import List
 from fastapi import UploadFile
+import aiofiles
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Tamanho dos blocos lidos do upload e gravados no disco (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
 
 def save_uploaded_files(files: List[UploadFile]) -> Path:
     """
@@ -21,7 +26,7 @@ def save_uploaded_files(files: List[UploadFile]) -> Path:
         for file in files:
             file_path = temp_dir / file.filename
             with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+                shutil.copyfileobj(file.file, buffer, length=UPLOAD_CHUNK_SIZE)
         return temp_dir
     except Exception as e:
         logger.error(f"Erro ao salvar arquivos em {temp_dir}: {e}")
@@ -30,6 +35,30 @@ def save_uploaded_files(files: List[UploadFile]) -> Path:
         raise
 
 
+async def save_uploaded_files_async(files: List[UploadFile]) -> Path:
+    """
+    Versão assíncrona de 'save_uploaded_files': lê o upload em blocos de
+    1 MiB e grava com aiofiles, sem bloquear o event loop em arquivos grandes.
+    """
+    temp_dir = Path(tempfile.mkdtemp(prefix="shapefile_upload_"))
+    logger.info(f"Diretório temporário criado em: {temp_dir}")
+
+    try:
+        for file in files:
+            file_path = temp_dir / file.filename
+            async with aiofiles.open(file_path, "wb") as buffer:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await buffer.write(chunk)
+        return temp_dir
+    except Exception as e:
+        logger.error(f"Erro ao salvar arquivos em {temp_dir}: {e}")
+        await cleanup_temp_files_async(temp_dir)
+        raise
+
+
 def cleanup_temp_files(temp_dir: Path):
     """Remove o diretório temporário e todo o seu conteúdo."""
     if temp_dir and temp_dir.exists():
@@ -40,3 +69,9 @@ def cleanup_temp_files(temp_dir: Path):
         except Exception as e:
             logger.error(
                 f"Erro ao remover diretório temporário {temp_dir}: {e}")
+
+
+async def cleanup_temp_files_async(temp_dir: Path):
+    """Remove o diretório temporário em uma thread, sem bloquear o event loop."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, cleanup_temp_files, temp_dir)